@@ -0,0 +1,38 @@
+'''Compare the pure Python and numpy fletcher checksums on 4K-16M blocks.
+
+    python benchmarks/checksums.py [repeat]
+'''
+import os
+import sys
+import timeit
+
+# run as a script, only benchmarks/ is on the path, not the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zfs import util
+
+SIZES = [4 << 10, 128 << 10, 1 << 20, 16 << 20]
+
+
+def main(repeat=3):
+    if util.numpy is None:
+        print('numpy is not installed, only the pure Python checksums can be timed')
+    print('{:>10} {:>10} {:>12} {:>12} {:>8}'.format('size', 'checksum', 'python ms', 'numpy ms', 'speedup'))
+    for size in SIZES:
+        data = os.urandom(size)
+        for name in ('fletcher2', 'fletcher4'):
+            python = getattr(util, name + '_python')
+            # the pure Python versions take seconds on the largest blocks
+            python_time = min(timeit.repeat(lambda: python(data), number=1, repeat=repeat))
+            if util.numpy is None:
+                print('{:>10} {:>10} {:>12.3f}'.format(size, name, python_time * 1000))
+                continue
+            vectorized = getattr(util, name + '_numpy')
+            assert vectorized(data) == python(data)
+            numpy_time = min(timeit.repeat(lambda: vectorized(data), number=1, repeat=repeat))
+            print('{:>10} {:>10} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+                size, name, python_time * 1000, numpy_time * 1000, python_time / numpy_time))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,35 @@
+import collections
+
+import pytest
+
+# case name -> results, for the summary at the end of the run
+RESULTS = collections.OrderedDict()
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: a benchmark; only runs with -m benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    # benchmarks are slow and only mean much on a quiet machine, so they're opt-in
+    if 'benchmark' in (config.getoption('markexpr') or ''):
+        return
+    skip = pytest.mark.skip(reason='benchmarks only run with -m benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def benchmark_results():
+    return RESULTS
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+    terminalreporter.section('benchmarks')
+    terminalreporter.write_line('{:>14} {:>10} {:>8} {:>8}'.format('struct', 'ns', 'bytes', 'blocks'))
+    for name, result in RESULTS.items():
+        terminalreporter.write_line('{:>14} {:>10} {:>8} {:>8}'.format(
+            name, result['ns'], result['bytes'], result['blocks']))
@@ -0,0 +1,49 @@
+'''Time LZJB decompression of 128K blocks with each available backend.
+
+    python benchmarks/lzjb.py [repeat]
+'''
+import os
+import random
+import sys
+import timeit
+
+# run as a script, only benchmarks/ is on the path, not the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zfs import compression
+from zfs import lzjb
+
+BLOCK_SIZE = 128 << 10
+
+
+def samples():
+    rng = random.Random(0)
+    lines = b''.join(
+        b'2018-01-01 12:%02d:%02d host sshd[%d]: Accepted publickey for user%d from 10.0.%d.%d\n' % (
+            i // 60 % 60, i % 60, rng.randint(1000, 1100), rng.randint(1, 20), rng.randint(0, 3), rng.randint(0, 255))
+        for i in range(2000))
+    return {
+        'incompressible': os.urandom(BLOCK_SIZE),
+        'log': lines[:BLOCK_SIZE],
+        'sparse': (bytes(1000) + os.urandom(24)) * (BLOCK_SIZE // 1024),
+        'zeros': bytes(BLOCK_SIZE),
+    }
+
+
+def main(repeat=5):
+    codec = compression.lzjb
+    codec.self_test()
+    backends = [backend for backend in codec.backends if backend.decompress and not backend.error]
+    print('{:>16} {:>10} '.format('block', 'ratio') + ''.join('{:>12}'.format(b.name + ' MB/s') for b in backends))
+    for name, data in samples().items():
+        compressed = lzjb.compress(data)
+        row = '{:>16} {:>10.2f} '.format(name, len(data) / len(compressed))
+        for backend in backends:
+            assert backend.decompress(compressed, len(data)) == data
+            seconds = min(timeit.repeat(lambda: backend.decompress(compressed, len(data)), number=1, repeat=repeat))
+            row += '{:>12.1f}'.format(len(data) / seconds / 1e6)
+        print(row)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,197 @@
+'''Time parsing the on-disk structures from synthetic buffers, and measure
+what the parsed structs allocate.
+
+    python benchmarks/structs.py [--save] [repeat]
+
+Prints ns, bytes and memory blocks per struct for each case, next to the
+numbers in baseline.json. With --save, the results replace the baseline.
+The same cases run under pytest with `pytest -m benchmark benchmarks`.
+'''
+import collections
+import gc
+import io
+import json
+import os
+import platform
+import random
+import struct
+import sys
+import timeit
+import tracemalloc
+
+# run as a script, only benchmarks/ is on the path, not the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zfs import ondisk
+from zfs.constants import ObjectType
+from zfs.ondisk import fatzap
+from zfs.ondisk import zap
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+Case = collections.namedtuple('Case', 'name count setup parse')
+
+
+def random_bytes(rng, length):
+    return rng.getrandbits(length * 8).to_bytes(length, 'little')
+
+
+def blkptrs():
+    return random_bytes(random.Random(0), 1024 * 128)
+
+
+def dnodes():
+    rng = random.Random(1)
+    out = []
+    for i in range(512):
+        header = struct.pack('<8BHH4xQQ32x', ObjectType.PLAIN_FILE_CONTENTS, 17, 1, 1, ObjectType.SA, 0, 0, 0,
+                             256, 192, rng.randrange(1 << 20), rng.randrange(1 << 40))
+        dnode = header + random_bytes(rng, 128) + random_bytes(rng, 192)
+        out.append(dnode + bytes(512 - len(dnode)))
+    return b''.join(out)
+
+
+def uberblocks():
+    rng = random.Random(2)
+    out = []
+    for txg in range(128):
+        ub = struct.pack('<5Q', ondisk.Uberblock.MAGIC, 5000, txg, rng.getrandbits(64), 1500000000 + txg)
+        ub += random_bytes(rng, 128) + struct.pack('<Q', 5000)
+        out.append(ub + bytes(1024 - len(ub)))
+    return b''.join(out)
+
+
+def indirect_blocks():
+    return random_bytes(random.Random(3), 4 * (128 << 10))
+
+
+def microzap():
+    rng = random.Random(4)
+    out = [struct.pack('<QQQ40x', zap.ZapType.MicroZAP.value, rng.getrandbits(64), 0)]
+    for i in range((128 << 10) // 64 - 1):
+        name = 'file{}'.format(i).encode()
+        out.append(struct.pack('<QHI50s', rng.getrandbits(48), 0, rng.getrandbits(32), name))
+    return b''.join(out)
+
+
+def leaf_chunks():
+    rng = random.Random(5)
+    out = []
+    for i in range(638):
+        kind = rng.choice(list(fatzap.CHUNK_TYPES))
+        out.append(bytes([kind]) + random_bytes(rng, 23))
+    return b''.join(out)
+
+
+def parse_microzap(data):
+    # as ObjectSet._read_microzap does it
+    reader = io.BytesIO(data)
+    zap.MicroZAPHeader(reader)
+    return [zap.MicroZAP(reader) for _ in range(len(data) // 64 - 1)]
+
+
+def parse_leaf_chunks(data):
+    reader = io.BytesIO(data)
+    return [fatzap.parse_chunk(reader) for _ in range(len(data) // 24)]
+
+
+def parse_lazy_blkptrs(data):
+    # just what walking an indirect block looks at
+    blkptrs = [ondisk.Blockptr.from_buffer(data, i * 128, lazy=True) for i in range(len(data) // 128)]
+    for blkptr in blkptrs:
+        blkptr.level, blkptr.birth
+    return blkptrs
+
+
+def parse_lazy_dnodes(data):
+    # as ObjectSet.get_dnode does it, then looking at the type like parse_dnode
+    dnodes = [ondisk.DNode.from_buffer(data, i * 512, lazy=True) for i in range(len(data) // 512)]
+    for dnode in dnodes:
+        dnode.node_type
+    return dnodes
+
+
+CASES = [
+    Case('Blockptr', 1024, blkptrs,
+         lambda data: [ondisk.Blockptr(data[i:i + 128]) for i in range(0, len(data), 128)]),
+    Case('Blockptr lazy', 1024, blkptrs, parse_lazy_blkptrs),
+    Case('DNode', 512, dnodes,
+         lambda data: [ondisk.DNode(data[i:i + 512]) for i in range(0, len(data), 512)]),
+    Case('DNode lazy', 512, dnodes, parse_lazy_dnodes),
+    Case('Uberblock', 128, uberblocks,
+         lambda data: [ondisk.Uberblock(data[i:i + 1024]) for i in range(0, len(data), 1024)]),
+    Case('indirect 128K', 4, indirect_blocks,
+         lambda data: [ondisk.indirect(size=256)(data[i:i + (128 << 10)]) for i in range(0, len(data), 128 << 10)]),
+    Case('MicroZAP', (128 << 10) // 64 - 1, microzap, parse_microzap),
+    Case('LeafChunk', 638, leaf_chunks, parse_leaf_chunks),
+]
+
+
+def measure(case, repeat=5):
+    '''Time ``case`` and measure what its results hold on to, per struct.'''
+    data = case.setup()
+    parse = case.parse
+    parse(data)  # layouts are compiled the first time a struct is used
+    seconds = min(timeit.repeat(lambda: parse(data), number=1, repeat=repeat))
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    result = parse(data)
+    blocks = sys.getallocatedblocks() - blocks
+    del result
+    gc.collect()
+    tracemalloc.start()
+    result = parse(data)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return {
+        'ns': round(seconds / case.count * 1e9),
+        'bytes': round(size / case.count),
+        'blocks': round(blocks / case.count, 1),
+    }
+
+
+def python_version():
+    return '{} {}.{}'.format(platform.python_implementation(), *sys.version_info[:2])
+
+
+def load_baseline():
+    '''The saved results by case name, or {} if they're missing or from a
+    different Python, whose allocations won't be comparable.'''
+    try:
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    except IOError:
+        return {}
+    if baseline.get('python') != python_version():
+        return {}
+    return baseline['cases']
+
+
+def save_baseline(results):
+    with open(BASELINE, 'w') as f:
+        json.dump({'python': python_version(), 'cases': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(*args):
+    save = '--save' in args
+    args = [arg for arg in args if arg != '--save']
+    repeat = int(args[0]) if args else 5
+    baseline = load_baseline()
+    results = collections.OrderedDict()
+    print('{:>14} {:>6} {:>10} {:>8} {:>8} {:>10} {:>8}'.format(
+        'struct', 'count', 'ns', 'bytes', 'blocks', 'base ns', 'base B'))
+    for case in CASES:
+        result = results[case.name] = measure(case, repeat)
+        base = baseline.get(case.name, {})
+        print('{:>14} {:>6} {:>10} {:>8} {:>8} {:>10} {:>8}'.format(
+            case.name, case.count, result['ns'], result['bytes'], result['blocks'],
+            base.get('ns', '-'), base.get('bytes', '-')))
+    if save:
+        save_baseline(results)
+        print('saved to', BASELINE)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,17 @@
+import pytest
+
+import structs
+
+# what a struct allocates doesn't depend on the machine, unlike how long it
+# takes, so only allocations are held to the baseline
+ALLOWANCE = 1.1
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('case', structs.CASES, ids=[case.name for case in structs.CASES])
+def test_struct(case, benchmark_results):
+    result = benchmark_results[case.name] = structs.measure(case, repeat=3)
+    baseline = structs.load_baseline().get(case.name)
+    if baseline is None:
+        pytest.skip('no baseline for {} on {}'.format(case.name, structs.python_version()))
+    assert result['bytes'] <= baseline['bytes'] * ALLOWANCE + 16
@@ -2,15 +2,19 @@
 
 import argparse
 import logging
+import shutil
 import sys
 
 from pprint import pprint
 
 import zfs.posix
 from nvlist import NVList
+from zfs import blockdev
+from zfs import compression
 from zfs import filedev
+from zfs import pipeline
 from zfs.posix import posix_file
-from zfs.constants import ObjectType, TryConfig
+from zfs.constants import ObjectType, TryConfig, Verify
 from zfs.pool import Pool
 
 try:
@@ -31,6 +35,8 @@ TRY_LEVELS = [
     {TryConfig.read_all_dvas: True}
 ]
 
+EXTRACT_CHUNK_SIZE = 1 << 20
+
 logger = logging.getLogger(__name__)
 
 
@@ -51,6 +57,32 @@ class PoolExplorer(object):
         pool_parser.add_argument('--vdev-id', type=int, default=None)
         pool_parser.add_argument('--label', '-L', type=int, default=None)
         pool_parser.add_argument('--txg', '-T', type=int, default=None)
+        pool_parser.add_argument('--mmap', action='store_true',
+            help='Memory-map the pool images instead of reading them.')
+        pool_parser.add_argument('--direct', action='store_true',
+            help='Read the pool devices with O_DIRECT, bypassing the page cache.')
+        pool_parser.add_argument('--readahead', type=int, default=0, metavar='KiB',
+            help='Read KiB at a time from the pool devices and serve sequential reads from that window.')
+        pool_parser.add_argument('--cache-size', type=int, default=64, metavar='MiB',
+            help='Size of the decompressed block cache, in MiB. 0 disables it.')
+        pool_parser.add_argument('--compressed-cache-size', type=int, default=0, metavar='MiB',
+            help='Size of the cache holding blocks in their compressed form, in MiB.'
+            ' Blocks are decompressed again on every hit. 0 (the default) disables it.')
+        pool_parser.add_argument('--cache-dir', metavar='DIR', default=None,
+            help='Keep metadata blocks in DIR between runs. Cached blocks are checked'
+            ' against their block pointer checksums before use.')
+        pool_parser.add_argument('--cache-dir-size', type=int, default=1024, metavar='MiB',
+            help='Keep --cache-dir under this many MiB, dropping the least recently used blocks first.')
+        pool_parser.add_argument('--verify', type=Verify, default=Verify.ALWAYS,
+            choices=list(Verify), metavar='POLICY',
+            help='Which blocks to checksum: always (the default), once, metadata, sampled, or off.'
+            ' "once" checks each block the first time it is read, "sampled" checks a random sixteenth.'
+            ' Blocks read from --cache-dir are always checked.')
+        pool_parser.add_argument('--workers', type=int, default=0, metavar='N',
+            help='Read up to N blocks of a file at once. 0 (the default) reads one at a time.')
+        pool_parser.add_argument('--executor', choices=pipeline.EXECUTORS, default='thread',
+            help='Where --workers checksum and decompress blocks. Threads suit the native codecs;'
+            ' processes suit the pure Python ones, which hold the GIL.')
 
 
         log_opts = parser.add_argument_group('logging options',
@@ -95,6 +127,15 @@ class PoolExplorer(object):
         parser_cat.add_argument('path', help='Output the contents of PATH.')
 
 
+        parser_extract = subcommands.add_parser('extract', parents=[pool_parser],
+            help='copy a file out of the pool')
+        parser_extract.set_defaults(func=self.extract)
+        parser_extract.add_argument('path', help='The file to copy.')
+        parser_extract.add_argument('dest', help='Where to write it.')
+        parser_extract.add_argument('--no-sparse', dest='sparse', action='store_false',
+            help='Write holes out as zeros instead of leaving them unallocated.')
+
+
         parser_objset = subcommands.add_parser('objectset', parents=[pool_parser], aliases=['objset'],
             help='inspect object sets')
         parser_objset.set_defaults(func=self.objset)
@@ -125,6 +166,10 @@ class PoolExplorer(object):
         parser_nvparse.set_defaults(func=self.nvparse)
         parser_nvparse.add_argument('file', help='The file to parse.')
 
+        parser_codecs = subcommands.add_parser('codecs',
+            help='Show the decompression backend in use for each codec.')
+        parser_codecs.set_defaults(func=self.codecs)
+
         parser_label = subcommands.add_parser('label', parents=[pool_parser], help='View disk labels.')
         parser_label.set_defaults(func=self.label)
         parser_label.add_argument('label', type=int, default=0, nargs='?', choices=(0, 1, 2, 3),
@@ -157,6 +202,9 @@ class PoolExplorer(object):
 
     def cli(self, *a, **kw):
         args = self.parser.parse_args(*a, **kw)
+        if args.pool and args.mmap and (args.direct or args.readahead):
+            # those are BlockDev options, and a BlockDev isn't memory-mapped
+            self.parser.error('--mmap can\'t be combined with --direct or --readahead')
         level = VERBOSE_LEVELS[args.verbose]
         logging.basicConfig(level=level, format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
         if level != logging.CRITICAL:
@@ -166,17 +214,40 @@ class PoolExplorer(object):
             self.pool = self.load_pool(args)
         if args.pool and args.vdev_id == None:
             args.vdev_id = int(self.pool.first_vdev().id)
-        args.func(args)
+        try:
+            args.func(args)
+        finally:
+            if args.pool:
+                self.pool.close()
 
 
     def load_pool(self, args):
         # TODO: parse disk label to find other vdevs
-        devices = [filedev.FileDev(path, args.label, args.txg) for path in args.pool]
+        devices = [self.load_device(path, args) for path in args.pool]
         try_config = set(args.try_config).union(*TRY_LEVELS[:args.try_level+1])
         logger.info('extra options: {}'.format(try_config))
-        pool = Pool(devices, try_config=try_config)
+        pool = Pool(devices, try_config=try_config,
+            cache_size=args.cache_size << 20,
+            compressed_cache_size=args.compressed_cache_size << 20,
+            cache_dir=args.cache_dir,
+            cache_dir_size=args.cache_dir_size << 20,
+            verify=args.verify,
+            workers=args.workers,
+            executor=args.executor,
+        )
         return pool
 
+    def load_device(self, path, args):
+        if args.direct or args.readahead or path.startswith('/dev/'):
+            return blockdev.BlockDev(path, args.label, args.txg,
+                direct=args.direct,
+                readahead=args.readahead << 10,
+            )
+        elif args.mmap:
+            return filedev.MmapDev(path, args.label, args.txg)
+        else:
+            return filedev.FileDev(path, args.label, args.txg)
+
     def list_cmd(self, args):
         target = self.pool.open(args.path)
         # logger.info(target.attrs)
@@ -188,7 +259,26 @@ class PoolExplorer(object):
                 # print(file.decode('utf8'))
 
     def cat(self, args):
-        sys.stdout.buffer.write(self.pool.read_file(args.path))
+        with self.pool.open(args.path).open() as f:
+            shutil.copyfileobj(f, sys.stdout.buffer)
+
+    def extract(self, args):
+        source = self.pool.open(args.path)
+        with source.open() as f, open(args.dest, 'wb') as out:
+            for offset, length, is_data in source.data_extents():
+                if not is_data and args.sparse:
+                    # leave a hole in the output too
+                    continue
+                # each extent goes at its own offset, even if the one before it was cut short
+                out.seek(offset)
+                f.seek(offset)
+                while length > 0:
+                    chunk = f.read(min(length, EXTRACT_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    length -= len(chunk)
+            out.truncate(source.attrs['ZPL_SIZE'])
 
     def show_object(self, args, os, obj):
         if args.parse:
@@ -250,6 +340,18 @@ class PoolExplorer(object):
         nv = NVList(data)
         pprint(nv.unpack_nvlist())
 
+    def codecs(self, args):
+        for codec, modes in compression.report():
+            active = codec.active
+            print('{}: {}'.format(codec.name, active.name if active else 'unavailable'))
+            print('    modes: {}'.format(', '.join(mode.name for mode in modes)))
+            for backend in codec.backends:
+                if backend.error:
+                    status = backend.error
+                else:
+                    status = 'self-test took {:.3f}ms'.format(backend.seconds * 1000)
+                print('    {}: {}'.format(backend.name, status))
+
     def label(self, args):
         vdev = self.pool.vdevs[args.vdev_id]
         label = vdev.best_label
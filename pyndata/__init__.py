@@ -11,6 +11,7 @@ from .field import Field
 from .integer import *
 from .nullstring import nullstring
 from .padding import padding
+from .structarray import StructArray
 from .structfield import StructField
 if sys.version_info[0] == 3:
     from .structure3 import Struct
@@ -29,6 +30,7 @@ __all__ = [
     'nullstring',
     'padding',
     'Struct',
+    'StructArray',
     'StructField',
     'VariableLength'
 ] + [
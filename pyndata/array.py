@@ -4,13 +4,18 @@ import struct
 import sys
 
 if sys.version_info[0] == 3:
+    from io import BytesIO as StringIO
     xrange = range
+else:
+    from StringIO import StringIO
 
+from . import layout
 from .field import Field
 from .error import error
 from .integer import integer
 from .structure import Struct
 from .structure import StructField
+from .structarray import StructArray
 from .variablelength import VariableLength
 
 class array(VariableLength, Field):
@@ -20,6 +25,13 @@ class array(VariableLength, Field):
         kind (Field): a :class:`Field` or :class:`Struct` to be repeated.
         length: see :class:`VariableLength` for ways to specify the length of the array.
 
+    Keyword Arguments:
+        columns (bool): for arrays of fixed-size structs, unpack to a
+            :class:`StructArray` instead of a list, which only makes structs
+            as they're used, and can read a field of every element at once.
+
+    Elements that are fixed-size are all unpacked in one go.
+
     ::
 
         class S(pyndata.Struct):
@@ -28,7 +40,7 @@ class array(VariableLength, Field):
             a1 = pyndata.array(pyndata.uint32(), l1)
 
     '''
-    def __init__(self, kind, length):
+    def __init__(self, kind, length, columns=False):
         super(array, self).__init__()
         
         if issubclass(type(kind), Struct):
@@ -36,6 +48,7 @@ class array(VariableLength, Field):
         self.kind = kind
 
         self.length = length
+        self.columns = columns and isinstance(kind, StructField)
 
         self.default = []
 
@@ -43,7 +56,18 @@ class array(VariableLength, Field):
         return b''.join(self.kind.pack(item, _struct) for item in values)
 
     def unpack(self, reader, _struct):
+        count = self.get_length(_struct)
+        items = layout.items_decoder(self.kind, _struct.__ENDIAN__)
+        if items is not None:
+            size, decode = items
+            data = reader.read(count * size)
+            if len(data) == count * size:
+                if self.columns:
+                    return StructArray(self.kind.struct, data, 0, count)
+                return decode(data)
+            # let the elements decide what to do about running out of data
+            reader = StringIO(data)
         out = []
-        for x in xrange(self.get_length(_struct)):
+        for x in xrange(count):
             out.append(self.kind.unpack(reader, _struct))
         return out
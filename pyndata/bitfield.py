@@ -33,6 +33,8 @@ class BitField(object):
         self.enum = enum
 
     def __get__(self, obj, kind=None):
+        if obj is None:
+            return self
         value = self.field.__get__(obj)
         value = (value & self.mask) >> self.shift
         try:
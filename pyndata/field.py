@@ -14,6 +14,19 @@ if sys.version_info[0] == 3:
 else:
     __nextfield__ = itertools.count().next
 
+# The value of a field that hasn't been decoded yet, in a struct unpacked
+# lazily by Struct.from_buffer.
+NOT_DECODED = object()
+
+
+def own_values(obj):
+    '''The list of obj's values, for changing. Lazily unpacked structs all
+    share one tuple of NOT_DECODED until a field is decoded or set.'''
+    values = obj._values
+    if type(values) is tuple:
+        values = obj._values = list(values)
+    return values
+
 class Field(object):
     '''Parent class of all fields used in :class:`Struct` .
     Subclass this and implement :meth:`pack` and :meth:`unpack` with your
@@ -31,12 +44,18 @@ class Field(object):
         self.default = default or self.__DEFAULT__
         self.__index__ = __nextfield__()
         self.name = None
+        self.position = None  # where the value lives in a struct's _values
 
     def __get__(self, obj, kind=None):
-        return obj.field_items[self.name]
+        if obj is None:
+            return self
+        value = obj._values[self.position]
+        if value is NOT_DECODED:
+            value = obj.__layout__.decode(obj, self)
+        return value
 
     def __set__(self, obj, value):
-        obj.field_items[self.name] = value
+        own_values(obj)[self.position] = value
 
     def pack(self, value, struct):
         '''Pack a value into a string.
@@ -0,0 +1,499 @@
+from __future__ import absolute_import
+
+import struct
+import threading
+
+from .error import error
+from .field import NOT_DECODED
+from .field import own_values
+
+# Unpacking field by field costs a read and a struct.unpack per integer,
+# which adds up fast for something like a block pointer. Most structs are
+# made entirely of fixed-size fields, though, so compile_layout() turns each
+# run of fixed-size fields into one struct.Struct plus a generated function
+# that stores the unpacked values (building any nested structs on the way).
+# Fields whose size depends on the data still unpack one at a time.
+#
+# Struct.from_buffer(..., lazy=True) skips all of that until a field is read:
+# each field also gets a decoder that unpacks just that field from its offset
+# in the buffer, so callers that only look at a few fields only pay for those.
+
+# the (id(obj), position) of each field each thread is lazily unpacking
+_local = threading.local()
+
+
+class Run(object):
+    '''Consecutive fixed-size fields, unpacked with a single struct.Struct.
+
+    ``apply(obj, data, offset)`` unpacks them from ``data`` into ``obj``.
+    '''
+    def __init__(self, fields, compiled, apply):
+        self.fields = fields
+        self.struct = compiled
+        self.size = compiled.size
+        self.apply = apply
+
+
+class Layout(object):
+    '''How a :class:`Struct` class unpacks: a list of steps, each either a
+    :class:`Run` or a single :class:`Field`.
+
+    If every field is fixed-size, ``fixed`` is True, there's exactly one run,
+    and ``build(values, index)`` makes a new instance of the class from its
+    values in a tuple unpacked by an enclosing struct.
+
+    For lazily unpacked instances, ``decoders`` holds a ``(step, offset,
+    decode)`` for each field, by position: the field is ``offset`` bytes
+    into the step, and ``decode(obj, buffer, offset)`` unpacks it from there.
+    ``sizes`` holds each step's size: an int, a function of the instance for
+    fields whose size depends on other fields, or None if it can only be
+    found by unpacking the field. ``prefix`` is how many bytes there are
+    before the first step whose size isn't fixed.
+    '''
+    def __init__(self, steps, endian, decoders, sizes, format=None, width=0, build=None):
+        self.steps = steps
+        self.endian = endian
+        self.fixed = len(steps) == 1 and isinstance(steps[0], Run)
+        self.size = steps[0].size if self.fixed else None
+        self.format = format
+        self.width = width
+        self.build = build
+        self.decoders = decoders
+        self.sizes = sizes
+        self.prefix = 0
+        for size in sizes:
+            if not isinstance(size, int):
+                break
+            self.prefix += size
+
+    def start(self, obj, step):
+        '''Where ``step`` starts in the lazily unpacked ``obj``, or None if
+        an earlier step has to be unpacked to find out.'''
+        start = 0
+        for size in self.sizes[:step]:
+            if size is None:
+                return None
+            start += size if isinstance(size, int) else size(obj)
+        return start
+
+    def decode(self, obj, field):
+        '''Unpack ``field`` of the lazily unpacked ``obj`` and store its value.'''
+        position = field.position
+        step, at, decode = self.decoders[position]
+        buffer, offset = obj._source
+        if step:
+            start = self.start(obj, step)
+            if start is None:
+                self._decode_rest(obj, buffer, offset)
+                value = obj._values[position]
+                return None if value is NOT_DECODED else value
+            at += start
+        try:
+            value = decode(obj, buffer, offset + at)
+        except struct.error as e:
+            raise error('Not enough bytes for field {}: {}'.format(field.name, e))
+        if value is NOT_DECODED:
+            return None
+        own_values(obj)[position] = value
+        return value
+
+    def _decode_rest(self, obj, buffer, offset):
+        # past a field we can't size without unpacking it, everything has to
+        # be unpacked in order; values that were already decoded (or set) stay
+        first = self.sizes.index(None)
+        reader = BufferReader(buffer, offset + self.start(obj, first))
+        values = own_values(obj)
+        for step in self.steps[first:]:
+            if isinstance(step, Run):
+                for field in step.fields:
+                    if values[field.position] is NOT_DECODED:
+                        _, at, decode = self.decoders[field.position]
+                        values[field.position] = decode(obj, buffer, reader.position + at)
+                reader.position += step.size
+            else:
+                value = _unpack_once(step, reader, obj)
+                if value is NOT_DECODED:
+                    # already being unpacked further up the stack, so there's
+                    # no telling where the rest starts
+                    return
+                if values[step.position] is NOT_DECODED:
+                    values[step.position] = value
+
+
+class BufferReader(object):
+    '''A file-like view of ``buffer`` from ``offset`` on, for fields that read
+    their data a piece at a time. Unlike a BytesIO, it doesn't copy the buffer.
+    '''
+    __slots__ = ('buffer', 'position')
+
+    def __init__(self, buffer, offset=0):
+        self.buffer = memoryview(buffer).cast('B')
+        self.position = offset
+
+    def read(self, size=-1):
+        start = self.position
+        end = len(self.buffer)
+        if size is not None and size >= 0:
+            end = min(start + size, end)
+        self.position = max(start, end)
+        return self.buffer[start:end].tobytes()
+
+    def tell(self):
+        return self.position
+
+
+class Piece(object):
+    # a fixed-size field: its struct format (without byte order), how many
+    # values it unpacks to, and source for turning those into the field's value
+    def __init__(self, format, width, source):
+        self.format = format
+        self.width = width
+        self.source = source  # source(index expression) -> expression
+
+
+def layout_of(cls):
+    '''The :class:`Layout` of the Struct class ``cls``, compiled the first time it's needed.'''
+    if cls.__layout__ is None:
+        cls.__layout__ = compile_layout(cls)
+    return cls.__layout__
+
+
+def compile_layout(cls):
+    '''Work out how to unpack the Struct class ``cls``, and generate code for it.'''
+    endian = '>' if cls.__ENDIAN__ == 'big' else '<'
+    namespace = {
+        'new': object.__new__,
+        'cls': cls,
+    }
+    steps = []
+    decoders = [None] * len(cls.fields)
+    run = []
+    at = 0
+    for field in cls.fields:
+        piece = _piece(field, cls.__ENDIAN__, namespace)
+        if piece is None:
+            if run:
+                steps.append(_compile_run(run, endian, namespace, len(run) == len(cls.fields)))
+                run = []
+                at = 0
+            decoders[field.position] = (len(steps), 0, _field_decoder(field))
+            steps.append(field)
+        else:
+            decoders[field.position] = (len(steps), at, _piece_decoder(field, piece, endian, namespace))
+            at += struct.calcsize(endian + piece.format)
+            run.append((field, piece))
+    if run:
+        steps.append(_compile_run(run, endian, namespace, len(run) == len(cls.fields)))
+    sizes = [step.size if isinstance(step, Run) else _sizer(step, cls.__ENDIAN__) for step in steps]
+    if not (len(steps) == 1 and isinstance(steps[0], Run)):
+        return Layout(steps, cls.__ENDIAN__, decoders, sizes)
+
+    pieces = [piece for _, piece in run]
+    lines = [
+        'def build(v, i):',
+        '    obj = new(cls)',
+        '    obj._values = [{}]'.format(_items(run, 'i')),
+        '    return obj',
+    ]
+    build = _define(lines, 'build', namespace)
+    return Layout(steps, cls.__ENDIAN__, decoders, sizes,
+                  ''.join(p.format for p in pieces), sum(p.width for p in pieces), build)
+
+
+def _compile_run(run, endian, namespace, whole):
+    compiled = struct.Struct(endian + ''.join(piece.format for _, piece in run))
+    namespace['unpack_from'] = compiled.unpack_from
+    if whole and any(_packed(field) for field, _ in run):
+        return _compile_packed_run(run, endian, namespace, compiled)
+    if whole:
+        lines = [
+            'def apply(obj, data, offset):',
+            '    v = unpack_from(data, offset)',
+            '    obj._values = [{}]'.format(_items(run, '')),
+        ]
+    else:
+        lines = [
+            'def apply(obj, data, offset):',
+            '    v = unpack_from(data, offset)',
+            '    values = obj._values',
+        ]
+        index = 0
+        for field, piece in run:
+            lines.append('    values[{}] = {}'.format(field.position, piece.source(_at('', index))))
+            index += piece.width
+    apply = _define(lines, 'apply', namespace)
+    return Run([field for field, _ in run], compiled, apply)
+
+
+def _packed(field):
+    # whether a field of a fixed-size struct is left packed until it's read:
+    # nested structs and arrays are whole objects of their own, and nobody
+    # looks at padding
+    from .array import array
+    from .padding import padding
+    from .structfield import StructField
+    return isinstance(field, (StructField, array, padding))
+
+
+def _compile_packed_run(run, endian, namespace, compiled):
+    # apply() for a fixed-size struct with _packed fields: only the rest are
+    # unpacked, and the struct keeps its bytes to decode the others from
+    # when they're read, like a lazily unpacked one
+    formats = []
+    items = []
+    index = 0
+    for field, piece in run:
+        if _packed(field):
+            formats.append('{}x'.format(struct.calcsize(endian + piece.format)))
+            items.append('NOT_DECODED')
+        else:
+            formats.append(piece.format)
+            items.append(piece.source(str(index)))
+            index += piece.width
+    scope = dict(namespace, NOT_DECODED=NOT_DECODED,
+                 unpack_from=struct.Struct(endian + ''.join(formats)).unpack_from)
+    lines = [
+        'def apply(obj, data, offset):',
+        '    v = unpack_from(data, offset)',
+        '    obj._values = [{}]'.format(', '.join(items)),
+        '    if type(data) is not bytes:',
+        '        # the struct mustn\'t change along with a mutable buffer',
+        '        data = bytes(data[offset:offset + {}])'.format(compiled.size),
+        '        offset = 0',
+        '    obj._source = (data, offset)',
+    ]
+    apply = _define(lines, 'apply', scope)
+    return Run([field for field, _ in run], compiled, apply)
+
+
+def _piece_decoder(field, piece, endian, namespace):
+    # decode(obj, buffer, offset) for a fixed-size field; nested structs are
+    # left to decode their own fields lazily too
+    from .array import array
+    from .structfield import StructField
+    if isinstance(field, StructField):
+        return _lazy_struct(field.struct)
+    if isinstance(field, array) and isinstance(field.kind, StructField):
+        return _lazy_structs(field.kind.struct, lambda obj: field.length)
+    scope = dict(namespace, unpack_from=struct.Struct(endian + piece.format).unpack_from)
+    lines = [
+        'def decode(obj, buffer, offset):',
+        '    v = unpack_from(buffer, offset)',
+        '    return {}'.format(piece.source('0')),
+    ]
+    return _define(lines, 'decode', scope)
+
+
+def _field_decoder(field):
+    # decode(obj, buffer, offset) for a field that unpacks itself
+    if _struct_items(field) is not None:
+        if field.columns:
+            from .structarray import StructArray
+            cls = field.kind.struct
+            return lambda obj, buffer, offset: StructArray(cls, buffer, offset, field.get_length(obj))
+        return _lazy_structs(field.kind.struct, field.get_length)
+
+    def decode(obj, buffer, offset):
+        return _unpack_once(field, BufferReader(buffer, offset), obj)
+    return decode
+
+
+def _unpack_once(field, reader, obj):
+    # field.unpack(reader, obj), or NOT_DECODED if this thread is already
+    # unpacking that field of obj further up the stack. Anything that looks
+    # at the field meanwhile (like the repr of obj in an error message) sees
+    # None; obj itself isn't touched, since other threads may be reading it.
+    unpacking = getattr(_local, 'unpacking', None)
+    if unpacking is None:
+        unpacking = _local.unpacking = set()
+    key = (id(obj), field.position)
+    if key in unpacking:
+        return NOT_DECODED
+    unpacking.add(key)
+    try:
+        return field.unpack(reader, obj)
+    finally:
+        unpacking.discard(key)
+
+
+def _lazy_struct(cls):
+    def decode(obj, buffer, offset):
+        return cls.from_buffer(buffer, offset, True)
+    return decode
+
+
+def _lazy_structs(cls, count):
+    size = layout_of(cls).size
+    def decode(obj, buffer, offset):
+        return [cls.from_buffer(buffer, offset + i * size, True) for i in range(count(obj))]
+    return decode
+
+
+def _struct_items(field):
+    # the size of each item of an array of fixed-size structs, or None
+    from .array import array
+    from .structfield import StructField
+    if not (isinstance(field, array) and type(field).unpack is array.unpack):
+        return None
+    kind = field.kind
+    if not (isinstance(kind, StructField) and type(kind).unpack is StructField.unpack):
+        return None
+    return layout_of(kind.struct).size
+
+
+def _sizer(field, endian):
+    # the size of a field that isn't part of a run; see Layout.sizes
+    from .array import array
+    from .bytestring import bytestring
+    from .structfield import StructField
+    kind = type(field)
+    if isinstance(field, StructField) and kind.unpack is StructField.unpack:
+        return layout_of(field.struct).size
+    elif isinstance(field, bytestring) and kind.unpack is bytestring.unpack:
+        return field.get_length
+    elif isinstance(field, array) and kind.unpack is array.unpack:
+        size = _struct_items(field)
+        if size is None:
+            piece = _piece(field.kind, endian, {})
+            if piece is None:
+                return None
+            size = struct.calcsize(('>' if endian == 'big' else '<') + piece.format)
+        return lambda obj: field.get_length(obj) * size
+    return None
+
+
+_items_decoders = {}
+
+
+def items_decoder(kind, endian):
+    '''``(size, decode)`` for unpacking consecutive ``kind`` fields all at
+    once, where ``decode(data)`` returns a list of their values, or None if
+    ``kind`` isn't fixed-size. ``endian`` is the enclosing struct's.'''
+    key = (kind, endian)
+    if key not in _items_decoders:
+        _items_decoders[key] = _compile_items(kind, endian)
+    return _items_decoders[key]
+
+
+def _compile_items(kind, endian):
+    namespace = {}
+    piece = _piece(kind, endian, namespace)
+    if piece is None:
+        return None
+    compiled = struct.Struct(('>' if endian == 'big' else '<') + piece.format)
+    if not compiled.size:
+        return None
+    namespace['iter_unpack'] = compiled.iter_unpack
+    lines = [
+        'def decode(data):',
+        '    return [{} for v in iter_unpack(data)]'.format(piece.source('0')),
+    ]
+    return compiled.size, _define(lines, 'decode', namespace)
+
+
+def _items(run, base):
+    items = []
+    index = 0
+    for field, piece in run:
+        items.append(piece.source(_at(base, index)))
+        index += piece.width
+    return ', '.join(items)
+
+
+def _at(base, index):
+    if not base:
+        return str(index)
+    return '{} + {}'.format(base, index) if index else base
+
+
+def _define(lines, name, namespace):
+    # each function gets its own copy of the namespace, since runs share names
+    scope = dict(namespace)
+    exec('\n'.join(lines), scope)
+    return scope[name]
+
+
+def _name(namespace, prefix, value):
+    name = '{}{}'.format(prefix, len(namespace))
+    namespace[name] = value
+    return name
+
+
+def _piece(field, endian, namespace):
+    # a Piece for a fixed-size field, or None if it has to be unpacked on its own
+    from .array import array
+    from .bytestring import bytestring
+    from .integer import integer
+    from .nullstring import nullstring
+    from .padding import padding
+    from .structfield import StructField
+
+    kind = type(field)
+    if isinstance(field, integer) and kind.unpack is integer.unpack:
+        if (field.__ENDIAN__ or endian) != endian:
+            return None
+        return Piece(kind.__TYPE__, 1, _converter(field.enum, namespace))
+    elif isinstance(field, padding) and kind.unpack is padding.unpack:
+        return Piece('{}s'.format(field.length), 1, lambda x: 'v[{}]'.format(x))
+    elif isinstance(field, bytestring) and kind.unpack is bytestring.unpack:
+        if not isinstance(field.length, int):
+            return None
+        return Piece('{}s'.format(field.length), 1, lambda x: 'v[{}]'.format(x))
+    elif isinstance(field, nullstring) and kind.unpack is nullstring.unpack:
+        if not field.padded:
+            return None
+        name = _name(namespace, 'string', _nullstring(field.encoding))
+        return Piece('{}s'.format(field.max_length), 1, lambda x: '{}(v[{}])'.format(name, x))
+    elif isinstance(field, StructField) and kind.unpack is StructField.unpack:
+        layout = layout_of(field.struct)
+        if not layout.fixed or layout.endian != endian:
+            return None
+        name = _name(namespace, 'build', layout.build)
+        return Piece(layout.format, layout.width, lambda x: '{}(v, {})'.format(name, x))
+    elif isinstance(field, array) and kind.unpack is array.unpack:
+        if not isinstance(field.length, int) or field.columns:
+            return None
+        item = _piece(field.kind, endian, namespace)
+        if item is None:
+            return None
+        count = field.length
+        width = item.width
+        if item.source('x') == 'v[x]':
+            source = lambda x: 'list(v[{0}:{0} + {1}])'.format(x, count)
+        else:
+            source = lambda x: '[{} for j in range({}, {} + {}, {})]'.format(
+                item.source('j'), x, x, count * width, width)
+        if len(item.format) == 1:
+            return Piece('{}{}'.format(count, item.format), count * width, source)
+        return Piece(item.format * count, count * width, source)
+    return None
+
+
+def _converter(enum, namespace):
+    # integer fields try to convert their values to enum members, and keep the plain value if they can't
+    if enum is None:
+        return lambda x: 'v[{}]'.format(x)
+    try:
+        members = dict((member.value, member) for member in enum)
+    except TypeError:
+        members = None
+    if members is not None:
+        name = _name(namespace, 'members', members)
+        return lambda x: '{0}.get(v[{1}], v[{1}])'.format(name, x)
+
+    def convert(value):
+        try:
+            return enum(value)
+        except:
+            return value
+    name = _name(namespace, 'convert', convert)
+    return lambda x: '{}(v[{}])'.format(name, x)
+
+
+def _nullstring(encoding):
+    def convert(value):
+        value = value.rstrip(b'\0')
+        if encoding:
+            value = value.decode(encoding)
+        return value
+    return convert
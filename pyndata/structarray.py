@@ -0,0 +1,144 @@
+from __future__ import absolute_import
+
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .bitfield import BitField
+from .error import error
+from .layout import layout_of
+
+# numpy dtypes for struct's integer type codes, without byte order
+INTEGER_DTYPES = {
+    'b': 'i1', 'B': 'u1',
+    'h': 'i2', 'H': 'u2',
+    'i': 'i4', 'I': 'u4',
+    'l': 'i4', 'L': 'u4',
+    'q': 'i8', 'Q': 'u8',
+}
+
+_dtypes = {}
+
+
+class StructArray(Sequence):
+    '''``count`` fixed-size ``struct`` structs stored back to back in
+    ``buffer``, starting ``offset`` bytes in.
+
+    Indexing with an int gives the struct at that index, unpacked lazily
+    (see :meth:`Struct.from_buffer`) the first time it's used. Indexing
+    with a field's name gives that field of every element at once, as a
+    numpy array; see :meth:`column`.
+    '''
+    __slots__ = ('struct', 'buffer', 'offset', 'size', 'count', 'items')
+
+    def __init__(self, struct, buffer, offset=0, count=None):
+        compiled = layout_of(struct)
+        if not compiled.fixed:
+            raise TypeError('{} is not fixed-size'.format(struct.__name__))
+        self.struct = struct
+        self.buffer = buffer
+        self.offset = offset
+        self.size = compiled.size
+        available = (len(buffer) - offset) // compiled.size
+        if count is None:
+            count = available
+        elif count > available:
+            raise error('Not enough bytes for {} {} structs, only {}'.format(count, struct.__name__, available))
+        self.count = count
+        self.items = {}
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return self.column(index)
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('StructArray index out of range')
+        item = self.items.get(index)
+        if item is None:
+            item = self.items[index] = self.struct.from_buffer(self.buffer, self.offset + index * self.size, True)
+        return item
+
+    def __repr__(self):
+        return '{}({}, {!r})'.format(type(self).__name__, self.struct.__name__, list(self))
+
+    def records(self):
+        '''The elements as a numpy structured array over the buffer, with the
+        struct's :func:`dtype_of`. Elements changed through their structs
+        aren't reflected in it.'''
+        return numpy.frombuffer(self.buffer, dtype_of(self.struct), self.count, self.offset)
+
+    def column(self, name):
+        '''Field ``name`` of every element, as a numpy array. BitFields are
+        masked and shifted out of their field, and enums are left as plain
+        numbers. Fields of nested structs are named with dots, like
+        ``'dvas.offset'``; for arrays, the result has an extra dimension.'''
+        return _column(self.struct, self.records(), name)
+
+
+def dtype_of(struct):
+    '''The numpy structured dtype of the fixed-size Struct class ``struct``,
+    with a member for each of its fields (but not its BitFields).'''
+    if numpy is None:
+        raise ImportError('numpy is needed for dtypes')
+    if struct not in _dtypes:
+        compiled = layout_of(struct)
+        if not compiled.fixed:
+            raise TypeError('{} is not fixed-size'.format(struct.__name__))
+        endian = '>' if compiled.endian == 'big' else '<'
+        _dtypes[struct] = numpy.dtype([(field.name, _dtype(field, endian)) for field in struct.fields])
+    return _dtypes[struct]
+
+
+def _dtype(field, endian):
+    # the fields of fixed-size structs are all ones the layout knows how to size
+    from .array import array
+    from .bytestring import bytestring
+    from .integer import integer
+    from .nullstring import nullstring
+    from .padding import padding
+    from .structfield import StructField
+
+    if isinstance(field, integer):
+        order = endian if field.__ENDIAN__ is None else ('>' if field.__ENDIAN__ == 'big' else '<')
+        return order + INTEGER_DTYPES[field.__TYPE__]
+    elif isinstance(field, padding):
+        return 'V{}'.format(field.length)
+    elif isinstance(field, bytestring):
+        return 'V{}'.format(field.length)
+    elif isinstance(field, nullstring):
+        return 'S{}'.format(field.max_length)
+    elif isinstance(field, StructField):
+        return dtype_of(field.struct)
+    elif isinstance(field, array):
+        return (_dtype(field.kind, endian), (field.length,))
+    raise TypeError("can't make a dtype for field {}".format(field.name))
+
+
+def _column(struct, records, name):
+    name, _, rest = name.partition('.')
+    field = getattr(struct, name, None)
+    if isinstance(field, BitField):
+        values = records[field.field.name]
+        kind = values.dtype.type
+        return (values & kind(field.mask)) >> kind(field.shift)
+    if name not in struct.__positions__:
+        raise KeyError('{} has no field {}'.format(struct.__name__, name))
+    values = records[name]
+    if not rest:
+        return values
+    kind = getattr(field, 'kind', field)
+    if not hasattr(kind, 'struct'):
+        raise KeyError('{} is not a struct'.format(name))
+    return _column(kind.struct, values, rest)
@@ -3,14 +3,23 @@ from __future__ import absolute_import
 import copy
 import sys
 
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
 if sys.version_info[0] == 3:
     from io import BytesIO as StringIO
 else:
     try: from cStringIO import StringIO
     except: from StringIO import StringIO
 
+from . import layout
 from .bitfield import BitField
+from .error import error
 from .field import __nextfield__
+from .field import NOT_DECODED
+from .field import own_values
 from .field import Field
 from .structfield import StructField
 
@@ -24,12 +33,15 @@ from .structfield import StructField
 # "Struct" before "class Struct(object" (and the on in the base classes there)
 # with "FirstStruct".
 class Struct(object):
-    pass
+    __slots__ = ()
 
 class StructMeta(type):
     '''Makes an ordered list of fields from a class definition.
     '''
     def __new__(cls, cls_name, bases, attrs):
+        # instances keep their values in a list rather than a dict; see Struct.__slots__
+        slots = attrs.get('__slots__', ())
+        attrs['__slots__'] = (slots,) if isinstance(slots, str) else tuple(slots)
         fields = []
         bitfields = []
         field_defaults = {}
@@ -49,12 +61,51 @@ class StructMeta(type):
                     field.__SHOW__ = False
                 bitfields.append(field)
         fields.sort(key=lambda x:x.__index__)
+        for position, field in enumerate(fields):
+            field.position = position
         new_cls = type.__new__(cls, cls_name, bases, attrs)
         new_cls.field_defaults = field_defaults
         new_cls.fields = fields
         new_cls.bitfields = bitfields
+        new_cls.__positions__ = dict((field.name, field.position) for field in fields)
+        new_cls.__not_decoded__ = (NOT_DECODED,) * len(fields)
+        defaults = [field.default for field in fields]
+        new_cls.__default_values__ = defaults
+        # only defaults that can be changed in place need copying for each instance
+        new_cls.__mutable_defaults__ = [
+            position for position, value in enumerate(defaults)
+            if not isinstance(value, (int, float, bytes, str, type(None)))
+        ]
+        # compiled the first time the class unpacks anything; see layout.py
+        new_cls.__layout__ = None
         return new_cls
 
+class FieldItems(MutableMapping):
+    '''A view of a struct's field values, by name. Changes write through to
+    the struct.'''
+    __slots__ = ('struct',)
+
+    def __init__(self, struct):
+        self.struct = struct
+
+    def __getitem__(self, name):
+        return self.struct.fields[self.struct.__positions__[name]].__get__(self.struct)
+
+    def __setitem__(self, name, value):
+        own_values(self.struct)[self.struct.__positions__[name]] = value
+
+    def __delitem__(self, name):
+        raise TypeError("can't delete struct field {}".format(name))
+
+    def __iter__(self):
+        return iter(field.name for field in self.struct.fields)
+
+    def __len__(self):
+        return len(self.struct.fields)
+
+    def __repr__(self):
+        return repr(dict(self))
+
 class Struct(Struct):
     ''':class:`Struct` is where the magic happens.
 
@@ -65,13 +116,23 @@ class Struct(Struct):
     '''
     __metaclass__ = StructMeta
     __ENDIAN__ = 'little'
+    # Field values live in _values, in field order. Structs built while
+    # unpacking an enclosing struct skip __init__, so they only have _values;
+    # _items and __index__ are set when needed. Structs with fields that
+    # aren't decoded yet (lazily unpacked ones, and fixed-size ones with
+    # nested structs or arrays) keep the (buffer, offset) they came from in
+    # _source. A __dict__ is only allocated for instances that are given
+    # other attributes.
+    __slots__ = ('_values', '_items', '__index__', '_source', '__dict__')
 
     def __init__(self, initial=None, **kwargs):
         self.__index__ = __nextfield__()
         if initial:
-            self.field_items = {}
+            self._values = [None] * len(self.fields)
         else:
-            self.field_items = copy.deepcopy(self.field_defaults)
+            self._values = values = list(self.__default_values__)
+            for position in self.__mutable_defaults__:
+                values[position] = copy.deepcopy(values[position])
         for k, v in kwargs.items():
             if hasattr(self, k):
                 setattr(self, k, v)
@@ -80,6 +141,39 @@ class Struct(Struct):
         if initial:
             self.unpack(initial)
 
+    @classmethod
+    def from_buffer(cls, buffer, offset=0, lazy=False):
+        '''Unpack an instance from ``buffer`` (a bytes-like object), starting
+        ``offset`` bytes in, without copying it first.
+
+        With ``lazy``, fields are decoded the first time they're read instead:
+        the instance keeps a reference to ``buffer``, which mustn't change
+        while it's in use, and nested structs are unpacked lazily in turn.
+        If the buffer turns out to be too short, the error comes from reading
+        the field that needed the missing data.
+
+        Like structs unpacked as part of another struct, the instance is
+        made without calling ``__init__``.
+        '''
+        compiled = cls.__layout__ or layout.layout_of(cls)
+        obj = object.__new__(cls)
+        if lazy and len(buffer) - offset >= compiled.prefix:
+            obj._values = cls.__not_decoded__
+            obj._source = (buffer, offset)
+        else:
+            obj._values = [None] * len(cls.fields)
+            obj.unpack(buffer, offset)
+        return obj
+
+    @property
+    def field_items(self):
+        '''The struct's field values as a dict-like :class:`FieldItems`, by name.'''
+        try:
+            return self._items
+        except AttributeError:
+            self._items = FieldItems(self)
+            return self._items
+
     def __repr__(self):
         fields = [field.name+'='+repr(getattr(self, field.name)) for field in self.fields if field.__SHOW__]
         fields.extend(field.name+'='+repr(field.__get__(self)) for field in self.bitfields if field.__SHOW__)
@@ -95,11 +189,31 @@ class Struct(Struct):
             out.append(field.pack(field.__get__(self), self))
         return b''.join(out)
 
-    def unpack(self, reader):
-        '''unpack takes a :class:`str` or a file-like object and calls the unpack method
-        of each Field in the struct in order.
+    def unpack(self, reader, offset=0):
+        '''unpack takes a bytes-like object or a file-like object and calls the unpack method
+        of each Field in the struct in order. Bytes-like objects are read
+        from ``offset`` on.
+
+        Runs of fixed-size fields are unpacked together, with one precompiled
+        :class:`struct.Struct`.
         '''
-        if isinstance(reader, (str, bytes)):
-            reader = StringIO(reader)
-        for field in self.fields:
+        compiled = self.__layout__ or layout.layout_of(type(self))
+        if isinstance(reader, (bytes, bytearray, memoryview)):
+            if compiled.fixed and len(reader) - offset >= compiled.size:
+                compiled.steps[0].apply(self, reader, offset)
+                return
+            reader = layout.BufferReader(reader, offset)
+        for step in compiled.steps:
+            if isinstance(step, layout.Run):
+                data = reader.read(step.size)
+                if len(data) == step.size:
+                    step.apply(self, data, 0)
+                else:
+                    # let the fields decide what to do about running out of data
+                    self._unpack_fields(StringIO(data), step.fields)
+            else:
+                setattr(self, step.name, step.unpack(reader, self))
+
+    def _unpack_fields(self, reader, fields):
+        for field in fields:
             setattr(self, field.name, field.unpack(reader, self))
@@ -0,0 +1,79 @@
+import enum
+import io
+
+import pytest
+
+import pyndata
+from pyndata import layout
+
+class Color(enum.IntEnum):
+    RED = 1
+    GREEN = 2
+
+class Inner(pyndata.Struct):
+    a = pyndata.uint16()
+    b = pyndata.uint8(enum=Color)
+    c = pyndata.BitField(a, 4, 4)
+
+class Fixed(pyndata.Struct):
+    first = pyndata.uint32()
+    inner = Inner()
+    pad = pyndata.padding(2)
+    s = pyndata.bytestring(length=3)
+    name = pyndata.nullstring(max_length=6, padded=True)
+    ints = pyndata.array(pyndata.uint8(enum=Color), 3)
+    inners = pyndata.array(Inner(), 2)
+
+FIXED_DATA = (b'\x01\x00\x00\x00' + b'\xf3\x00\x02' + b'pp' + b'abc' + b'hi\0\0\0\0'
+              + b'\x01\x02\x07' + b'\x10\x00\x01' + b'\x20\x00\x09')
+
+class Partly(pyndata.Struct):
+    length = pyndata.uint8()
+    value = pyndata.uint16()
+    data = pyndata.bytestring(length=length)
+    tail = pyndata.uint16()
+
+class Mixed(pyndata.Struct):
+    __ENDIAN__ = 'big'
+    normal = pyndata.uint16()
+    little = pyndata.uint16(endian='little')
+
+def test_fixed_layout():
+    compiled = layout.layout_of(Fixed)
+    assert compiled.fixed
+    assert compiled.size == len(FIXED_DATA)
+
+def test_fixed_unpack():
+    x = Fixed(FIXED_DATA)
+    assert x.first == 1
+    assert x.inner.a == 0xf3 and x.inner.c == 0xf
+    assert x.inner.b is Color.GREEN
+    assert x.pad == b'pp'
+    assert x.s == b'abc'
+    assert x.name == 'hi'
+    assert x.ints == [Color.RED, Color.GREEN, 7]
+    assert [i.a for i in x.inners] == [0x10, 0x20]
+    assert x.inners[0].b is Color.RED and x.inners[1].b == 9
+    assert x.pack() == FIXED_DATA
+
+def test_fixed_unpack_from_reader():
+    reader = io.BytesIO(FIXED_DATA + b'more')
+    Fixed(reader)
+    assert reader.read() == b'more'
+
+def test_fixed_unpack_too_short():
+    with pytest.raises(pyndata.error):
+        Fixed(FIXED_DATA[:2])
+
+def test_partly_fixed():
+    compiled = layout.layout_of(Partly)
+    assert not compiled.fixed
+    assert [type(step) for step in compiled.steps] == [layout.Run, pyndata.bytestring, layout.Run]
+    x = Partly(b'\x02\x05\x00ab\x07\x00')
+    assert (x.length, x.value, x.data, x.tail) == (2, 5, b'ab', 7)
+
+def test_mixed_endian_unpacks_field_by_field():
+    assert not layout.layout_of(Mixed).steps[0].fields[1:]
+    x = Mixed(b'\x01\x02\x01\x02')
+    assert x.normal == 0x0102
+    assert x.little == 0x0201
@@ -0,0 +1,139 @@
+import enum
+
+import pytest
+
+import pyndata
+from pyndata.field import NOT_DECODED
+
+class Color(enum.IntEnum):
+    RED = 1
+    GREEN = 2
+
+class Inner(pyndata.Struct):
+    a = pyndata.uint16()
+    b = pyndata.uint8(enum=Color)
+    c = pyndata.BitField(a, 4, 4)
+
+class Fixed(pyndata.Struct):
+    first = pyndata.uint32()
+    inner = Inner()
+    name = pyndata.nullstring(max_length=4, padded=True)
+    inners = pyndata.array(Inner(), 2)
+
+FIXED_DATA = b'\x01\x00\x00\x00' + b'\xf3\x00\x02' + b'hi\0\0' + b'\x10\x00\x01' + b'\x20\x00\x09'
+
+class Sized(pyndata.Struct):
+    count = pyndata.uint8()
+    items = pyndata.array(Inner(), length=count)
+    length = pyndata.uint8()
+    data = pyndata.bytestring(length=length)
+    tail = pyndata.uint16()
+
+SIZED_DATA = b'\x02' + b'\x01\x00\x01' + b'\x02\x00\x02' + b'\x03' + b'abc' + b'\x07\x00'
+
+class pstring(pyndata.Field):
+    # a length-prefixed string: there's no telling how long it is without reading it
+    def pack(self, value, struct):
+        return bytes([len(value)]) + value
+
+    def unpack(self, reader, struct):
+        return reader.read(ord(reader.read(1)))
+
+class Unsized(pyndata.Struct):
+    name = pstring()
+    after = pyndata.uint8()
+    last = pyndata.uint16()
+
+def test_unpack_from_offset():
+    x = Fixed()
+    x.unpack(b'junk' + FIXED_DATA, 4)
+    assert x.first == 1
+    assert x.inners[1].b == 9
+    y = Sized()
+    y.unpack(memoryview(b'junk' + SIZED_DATA), 4)
+    assert y.data == b'abc' and y.tail == 7
+
+def test_from_buffer():
+    x = Fixed.from_buffer(bytearray(b'??' + FIXED_DATA), 2)
+    assert x.first == 1 and x.name == 'hi'
+    assert x.pack() == FIXED_DATA
+
+def test_lazy_decodes_on_access():
+    x = Fixed.from_buffer(FIXED_DATA, lazy=True)
+    assert all(value is NOT_DECODED for value in x._values)
+    assert x.name == 'hi'
+    assert x._values[0] is NOT_DECODED
+    assert x.inner.b is Color.GREEN
+    assert x.inner._values[0] is NOT_DECODED
+    assert x.inner.c == 0xf
+    assert [inner.a for inner in x.inners] == [0x10, 0x20]
+    assert x.pack() == FIXED_DATA
+
+def test_lazy_matches_eager():
+    for cls, data in ((Fixed, FIXED_DATA), (Sized, SIZED_DATA)):
+        assert repr(cls.from_buffer(data, lazy=True)) == repr(cls(data))
+
+def test_lazy_variable_fields():
+    x = Sized.from_buffer(b'xyz' + SIZED_DATA, 3, lazy=True)
+    assert x.tail == 7
+    assert x.data == b'abc'
+    assert x.items[1].a == 2
+
+def test_lazy_after_unsized_field():
+    data = b'\x02ab' + b'\x05' + b'\x06\x00'
+    x = Unsized.from_buffer(data, lazy=True)
+    assert x.last == 6
+    assert x.after == 5
+    assert x.name == b'ab'
+
+def test_lazy_set_before_decoding():
+    x = Fixed.from_buffer(FIXED_DATA, lazy=True)
+    x.first = 9
+    x.inner.c = 0
+    assert x.first == 9
+    assert x.inner.a == 0x3
+
+def test_lazy_values_shared_until_decoded():
+    x = Fixed.from_buffer(FIXED_DATA, lazy=True)
+    y = Fixed.from_buffer(FIXED_DATA, lazy=True)
+    assert x._values is y._values
+    x.first = 9
+    assert y.first == 1
+    assert x._values is not y._values
+    assert x.first == 9
+    x.field_items['name'] = 'yo'
+    assert y.name == 'hi'
+    assert Fixed.from_buffer(FIXED_DATA, lazy=True).name == 'hi'
+
+def test_lazy_field_items():
+    x = Fixed.from_buffer(FIXED_DATA, lazy=True)
+    assert x.field_items['first'] == 1
+
+def test_lazy_short_buffer():
+    # too short to decode anything lazily, so it fails the same way eager unpacking does
+    with pytest.raises(pyndata.error):
+        Fixed.from_buffer(FIXED_DATA[:3], lazy=True)
+    x = Sized.from_buffer(SIZED_DATA[:-3], lazy=True)
+    assert x.items[0].a == 1
+    with pytest.raises(pyndata.error):
+        x.data
+
+class peeking(pyndata.Field):
+    # a field that looks at itself (and its struct's values) while being unpacked
+    def unpack(self, reader, struct):
+        self.seen = (getattr(struct, self.name), struct._values[self.position])
+        return reader.read(1)
+
+class Peeking(pyndata.Struct):
+    first = pyndata.uint8()
+    peek = peeking()
+    last = pyndata.uint8()
+
+def test_lazy_field_seen_while_unpacking():
+    x = Peeking.from_buffer(b'\x01?\x02', lazy=True)
+    assert x.peek == b'?'
+    # it reads as None, without the struct's values being changed under other threads
+    assert Peeking.peek.seen == (None, NOT_DECODED)
+    y = Peeking.from_buffer(b'\x01?\x02', lazy=True)
+    assert y.last == 2
+    assert Peeking.peek.seen == (None, NOT_DECODED)
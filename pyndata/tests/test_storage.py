@@ -0,0 +1,66 @@
+import pyndata
+from pyndata.field import NOT_DECODED
+
+class Inner(pyndata.Struct):
+    a = pyndata.uint8()
+
+class Outer(pyndata.Struct):
+    x = pyndata.uint16()
+    flag = pyndata.BitField(x, 1, 15)
+    inner = Inner()
+    items = pyndata.array(pyndata.uint8(), 2)
+
+class Extra(pyndata.Struct):
+    __slots__ = ('note',)
+    a = pyndata.uint8()
+
+def test_values_in_field_order():
+    x = Outer(b'\x01\x80\x02\x03\x04')
+    assert x._values[0] == 0x8001
+    # nested structs and arrays stay packed until they're read
+    assert x._values[1] is NOT_DECODED
+    assert x._values[2] is NOT_DECODED
+    assert x.inner.a == 2
+    assert x._values[1] is x.inner
+    assert x.items == [3, 4]
+
+def test_packed_fields_copy_mutable_buffers():
+    data = bytearray(b'\x01\x80\x02\x03\x04')
+    x = Outer.from_buffer(data)
+    data[2:] = b'\0\0\0'
+    assert x.inner.a == 2
+    assert x.items == [3, 4]
+    x.items[0] = 9
+    assert x.pack() == b'\x01\x80\x02\x09\x04'
+
+def test_no_instance_dict():
+    x = Outer(b'\x01\x80\x02\x03\x04')
+    assert 'x' not in getattr(x, '__dict__', {})
+    assert x.flag == 1
+
+def test_field_items_view():
+    x = Outer(b'\x01\x00\x02\x03\x04')
+    items = x.field_items
+    assert items is x.field_items
+    assert list(items) == ['x', 'inner', 'items']
+    assert items['x'] == 1
+    items['x'] = 7
+    assert x.x == 7
+
+def test_mutable_defaults_not_shared():
+    x = Outer()
+    y = Outer()
+    x.items.append(1)
+    x.inner.a = 5
+    assert y.items == []
+    assert y.inner.a == 0
+
+def test_class_access():
+    assert isinstance(Outer.x, pyndata.uint16)
+    assert isinstance(Outer.flag, pyndata.BitField)
+
+def test_declared_slots():
+    x = Extra(b'\x01')
+    x.note = 'hello'
+    assert x.note == 'hello'
+    assert x.a == 1
@@ -0,0 +1,105 @@
+import enum
+
+import pytest
+
+import pyndata
+from pyndata.structarray import dtype_of
+
+class Color(enum.IntEnum):
+    RED = 1
+    GREEN = 2
+
+class Item(pyndata.Struct):
+    a = pyndata.uint16()
+    low = pyndata.BitField(a, 4, 0)
+    high = pyndata.BitField(a, 4, 12)
+    color = pyndata.uint8(enum=Color)
+
+class Pair(pyndata.Struct):
+    items = pyndata.array(Item(), 2)
+    tag = pyndata.bytestring(length=2)
+
+class Items(pyndata.Struct):
+    count = pyndata.uint8()
+    items = pyndata.array(Item(), length=count)
+    tail = pyndata.uint8()
+
+class ItemColumns(pyndata.Struct):
+    count = pyndata.uint8()
+    items = pyndata.array(Item(), length=count, columns=True)
+    tail = pyndata.uint8()
+
+class BigItem(pyndata.Struct):
+    __ENDIAN__ = 'big'
+    a = pyndata.uint16()
+
+class BigItems(pyndata.Struct):
+    __ENDIAN__ = 'big'
+    count = pyndata.uint8()
+    items = pyndata.array(BigItem(), length=count)
+
+ITEMS = b'\x03' + b'\x01\xf0\x01' + b'\x02\x00\x02' + b'\x03\x10\x05' + b'\x09'
+
+def test_variable_array_unpacks_in_one_go():
+    x = Items(ITEMS)
+    assert [item.a for item in x.items] == [0xf001, 2, 0x1003]
+    assert [item.color for item in x.items] == [Color.RED, Color.GREEN, 5]
+    assert x.items[0].high == 0xf
+    assert x.tail == 9
+    assert x.pack() == ITEMS
+
+def test_variable_array_endian():
+    x = BigItems(b'\x02\x00\x01\x00\x02')
+    assert [item.a for item in x.items] == [1, 2]
+
+def test_variable_array_short():
+    with pytest.raises(pyndata.error):
+        Items(ITEMS[:5])
+
+def test_struct_array():
+    items = pyndata.StructArray(Item, b'xx' + ITEMS[1:-1], 2)
+    assert len(items) == 3
+    assert items[1].a == 2
+    assert items[-1].color == 5
+    assert items[0] is items[0]
+    assert [item.low for item in items[::2]] == [1, 3]
+    with pytest.raises(IndexError):
+        items[3]
+    with pytest.raises(pyndata.error):
+        pyndata.StructArray(Item, ITEMS, 0, 5)
+
+def test_columns_array():
+    x = ItemColumns(ITEMS)
+    assert isinstance(x.items, pyndata.StructArray)
+    assert [item.a for item in x.items] == [0xf001, 2, 0x1003]
+    assert x.tail == 9
+    assert x.pack() == ITEMS
+    lazy = ItemColumns.from_buffer(ITEMS, lazy=True)
+    assert isinstance(lazy.items, pyndata.StructArray)
+    assert lazy.tail == 9
+
+def test_column():
+    numpy = pytest.importorskip('numpy')
+    items = pyndata.StructArray(Item, ITEMS[1:-1])
+    assert items['a'].tolist() == [0xf001, 2, 0x1003]
+    assert items.column('high').tolist() == [0xf, 0, 1]
+    assert items['low'].tolist() == [1, 2, 3]
+    assert items['color'].tolist() == [1, 2, 5]
+    with pytest.raises(KeyError):
+        items['nope']
+
+def test_nested_column():
+    numpy = pytest.importorskip('numpy')
+    data = ITEMS[1:7] + b'ab' + ITEMS[7:10] + ITEMS[1:4] + b'cd'
+    pairs = pyndata.StructArray(Pair, data)
+    assert pairs['items.a'].tolist() == [[0xf001, 2], [0x1003, 0xf001]]
+    assert pairs['items.high'].tolist() == [[0xf, 0], [1, 0xf]]
+    assert pairs['tag'].tolist() == [b'ab', b'cd']
+
+def test_dtype():
+    numpy = pytest.importorskip('numpy')
+    assert dtype_of(Item) == numpy.dtype([('a', '<u2'), ('color', 'u1')])
+    assert dtype_of(BigItem) == numpy.dtype([('a', '>u2')])
+    assert dtype_of(Pair).itemsize == 8
+    with pytest.raises(TypeError):
+        dtype_of(Items)
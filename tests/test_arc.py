@@ -0,0 +1,53 @@
+from zfs.arc import ARC
+
+
+def test_hit_and_miss():
+    cache = ARC(100)
+    assert cache.get('a') is None
+    cache.put('a', b'x' * 10)
+    assert cache.get('a') == b'x' * 10
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_byte_budget():
+    cache = ARC(100)
+    for i in range(20):
+        cache.put(i, b'x' * 10)
+    assert cache.size <= 100
+    assert len(cache) == 10
+    assert cache.evictions == 10
+    cache.put('big', b'x' * 101)
+    assert 'big' not in cache
+
+
+def test_frequent_entries_survive_scan():
+    cache = ARC(100)
+    cache.put('hot', b'x' * 10)
+    cache.get('hot')
+    for i in range(50):
+        cache.put(i, b'x' * 10)
+    assert 'hot' in cache
+
+
+def test_ghost_hit_grows_recency_target():
+    cache = ARC(30)
+    cache.put('a', b'x' * 10)
+    cache.get('a')
+    for key in 'bcd':
+        cache.put(key, b'x' * 10)
+    assert 'b' not in cache
+    cache.put('b', b'x' * 10)
+    assert cache.target > 0
+    assert 'b' in cache.frequent
+
+
+def test_discard():
+    cache = ARC(100)
+    cache.put('a', b'x' * 10)
+    cache.get('a')
+    cache.put('b', b'x' * 10)
+    cache.discard('a')
+    cache.discard('b')
+    cache.discard('missing')
+    assert len(cache) == 0
+    assert cache.size == 0
@@ -0,0 +1,149 @@
+import random
+import zlib
+
+import pytest
+
+from zfs import compression
+from zfs import lzjb
+from zfs import zle
+from zfs import pylz4
+from zfs import util
+from zfs.constants import Compression
+
+SAMPLE = compression.SELF_TEST_SAMPLE
+
+
+@pytest.mark.parametrize('mode', [Compression.ON, Compression.LZJB, Compression.LZ4, Compression.GZIP_1, Compression.GZIP_9,
+                                  Compression.ZLE])
+def test_codec_has_working_backend(mode):
+    assert compression.get(mode).active is not None
+
+
+def test_vectors():
+    assert util.decompress(compression.LZJB_VECTOR, Compression.LZJB, len(SAMPLE)) == SAMPLE
+    assert util.decompress(compression.LZ4_VECTOR, Compression.LZ4, len(SAMPLE)) == SAMPLE
+    assert util.decompress(zlib.compress(SAMPLE), Compression.GZIP_6, len(SAMPLE)) == SAMPLE
+    assert util.decompress(compression.ZLE_VECTOR, Compression.ZLE, len(SAMPLE)) == SAMPLE
+
+
+def test_python_lz4():
+    payload = compression.lz4_payload(compression.LZ4_VECTOR)
+    assert pylz4.decompress(payload, len(SAMPLE)) == SAMPLE
+    # a literal-only block, with an extended literal length
+    literals = bytes(range(200))
+    block = bytes([0xf0, 200 - 15]) + literals
+    assert pylz4.decompress(block, 200) == literals
+    with pytest.raises(ValueError):
+        pylz4.decompress(block, 100)
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        util.decompress(b'', Compression.EMPTY, 0)
+
+
+def test_fastest_correct_backend_wins():
+    codec = compression.Codec('test', [(b'in', 3, b'out')])
+
+    def missing():
+        raise ImportError('missing')
+
+    codec.register('missing', missing)
+    codec.register('wrong', lambda: lambda data, size: b'bad')
+    codec.register('right', lambda: lambda data, size: b'out')
+    assert codec.active.name == 'right'
+    assert codec.decompress(b'in', 3) == b'out'
+    errors = {backend.name: backend.error for backend in codec.backends}
+    assert errors['missing'].startswith('not installed')
+    assert errors['wrong'].startswith('failed self-test')
+    assert errors['right'] is None
+
+
+def test_no_backend():
+    codec = compression.Codec('test', [(b'in', 3, b'out')])
+    codec.register('wrong', lambda: lambda data, size: b'bad')
+    with pytest.raises(ValueError):
+        codec.decompress(b'in', 3)
+
+
+def lzjb_samples():
+    rng = random.Random(14)
+    noise = bytes(rng.getrandbits(8) for _ in range(5000))
+    return {
+        'empty': b'',
+        'short': b'abc',
+        'noise': noise,
+        'zeros': bytes(128 << 10),
+        'runs': b''.join(bytes([i % 256]) * (i % 70) for i in range(3000)),
+        'text': SAMPLE * 40,
+        'mixed': noise[:700] + SAMPLE * 3 + bytes(5000) + noise,
+    }
+
+
+@pytest.mark.parametrize('name', sorted(lzjb_samples()))
+def test_lzjb_round_trip(name):
+    data = lzjb_samples()[name]
+    compressed = lzjb.compress(data)
+    assert lzjb.decompress(compressed, len(data)) == data
+    # decoding stops at the requested size, or when the input runs out
+    assert lzjb.decompress(compressed, len(data) // 2) == data[:len(data) // 2]
+    assert lzjb.decompress(compressed, len(data) + 100) == data
+
+
+def test_lzjb_decompress_into():
+    data = lzjb_samples()['mixed']
+    out = memoryview(bytearray(len(data) + 10))
+    assert lzjb.decompress_into(lzjb.compress(data), out) == len(data)
+    assert out[:len(data)] == data
+
+
+def test_lzjb_overlapping_match():
+    # one literal, then a match 66 long at distance 1
+    assert lzjb.decompress(bytes([0b10, ord('z'), 63 << 2, 1]), 67) == b'z' * 67
+
+
+def test_lzjb_repeated_match_groups():
+    # eight literals, then three groups of eight identical matches 66 long at distance 8
+    group = b'\xff' + bytes([63 << 2, 8]) * 8
+    assert lzjb.decompress(b'\0abcdefgh' + group * 3, 8 + 3 * 8 * 66) == b'abcdefgh' * 199
+
+
+def test_lzjb_bad_match():
+    with pytest.raises(ValueError):
+        lzjb.decompress(bytes([0b1, 0, 5]), 10)
+    # the same, in a group of matches that all reach back too far
+    with pytest.raises(ValueError):
+        lzjb.decompress(b'\xff' + bytes([63 << 2, 8]) * 8, 8 * 66)
+
+
+@pytest.mark.parametrize('mode, data', [
+    (Compression.LZJB, compression.LZJB_VECTOR),
+    (Compression.LZ4, compression.LZ4_VECTOR),
+    (Compression.GZIP_6, zlib.compress(SAMPLE)),
+    (Compression.ZLE, compression.ZLE_VECTOR),
+    (Compression.OFF, SAMPLE),
+])
+def test_decompress_into(mode, data):
+    buffer = bytearray(b'\xff' * (len(SAMPLE) + 20))
+    # decode into the middle of a larger buffer, leaving the rest alone
+    out = memoryview(buffer)[10:10 + len(SAMPLE)]
+    assert util.decompress_into(data, mode, out) == len(SAMPLE)
+    assert buffer[10:-10] == SAMPLE
+    assert buffer[:10] == buffer[-10:] == b'\xff' * 10
+
+
+@pytest.mark.parametrize('name', sorted(lzjb_samples()))
+def test_zle_round_trip(name):
+    data = lzjb_samples()[name]
+    compressed = zle.compress(data)
+    assert zle.decompress(compressed, len(data)) == data
+    assert zle.decompress(compressed, len(data) // 2) == data[:len(data) // 2]
+    # decoding into a dirty buffer still produces the zero runs
+    out = bytearray(b'\xff' * len(data))
+    assert zle.decompress_into(compressed, out) == len(data)
+    assert out == data
+
+
+def test_zle_runs():
+    # three literals, then a run of 192 zeros, the longest a single byte can encode
+    assert zle.decompress(b'\x02abc\xff', 195) == b'abc' + bytes(192)
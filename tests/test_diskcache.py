@@ -0,0 +1,100 @@
+import os
+import threading
+
+from zfs import ondisk
+from zfs import util
+from zfs.constants import Checksum, ObjectType
+from zfs.diskcache import DiskCache
+
+
+def make_blkptr(data, object_type=ObjectType.OBJECT_DIRECTORY):
+    blkptr = ondisk.Blockptr()
+    blkptr.checksum_type = Checksum.FLETCHER_4
+    blkptr.object_type = object_type
+    blkptr.checksum = list(util.fletcher4(data))
+    return blkptr
+
+
+def verifier(blkptr):
+    return lambda data: util.checksum(data, blkptr.checksum, blkptr.checksum_type)
+
+
+def test_round_trip(tmpdir):
+    cache = DiskCache(str(tmpdir))
+    data = b'metadata' * 64
+    blkptr = make_blkptr(data)
+    key = (0, 0x1234, 7)
+    assert cache.get(key, blkptr, verifier(blkptr)) is None
+    cache.put(key, blkptr, data)
+    assert cache.get(key, blkptr, verifier(blkptr)) == data
+    assert DiskCache(str(tmpdir)).get(key, blkptr, verifier(blkptr)) == data
+
+
+def test_corrupt_entry_rejected(tmpdir):
+    cache = DiskCache(str(tmpdir))
+    data = b'metadata' * 64
+    blkptr = make_blkptr(data)
+    key = (0, 0x1234, 7)
+    cache.put(key, blkptr, data)
+    filename = cache.filename(key, blkptr)
+    with open(filename, 'wb') as f:
+        f.write(b'stale' * 64)
+    assert cache.get(key, blkptr, verifier(blkptr)) is None
+    assert cache.rejected == 1
+    assert not os.path.exists(filename)
+
+
+def test_file_data_skipped(tmpdir):
+    cache = DiskCache(str(tmpdir))
+    data = b'contents' * 64
+    blkptr = make_blkptr(data, object_type=ObjectType.PLAIN_FILE_CONTENTS)
+    cache.put((0, 0x1234, 7), blkptr, data)
+    assert cache.writes == 0
+
+
+def test_evicts_least_recently_used(tmpdir):
+    cache = DiskCache(str(tmpdir), max_bytes=2048)
+    blocks = []
+    for i in range(3):
+        data = bytes([i + 1]) * 768
+        blocks.append(((0, i << 9, 7), make_blkptr(data), data))
+    for n, (key, blkptr, data) in enumerate(blocks[:2]):
+        cache.put(key, blkptr, data)
+        os.utime(cache.filename(key, blkptr), (n, n))
+    # reading the oldest entry makes it the most recently used
+    key, blkptr, data = blocks[0]
+    assert cache.get(key, blkptr, verifier(blkptr)) == data
+    cache.put(*blocks[2])
+    assert cache.evictions == 1
+    assert cache.size == 2 * 768
+    assert not os.path.exists(cache.filename(blocks[1][0], blocks[1][1]))
+    for key, blkptr, data in (blocks[0], blocks[2]):
+        assert cache.get(key, blkptr, verifier(blkptr)) == data
+    assert DiskCache(str(tmpdir)).size == 2 * 768
+
+
+def test_oversized_block_skipped(tmpdir):
+    cache = DiskCache(str(tmpdir), max_bytes=256)
+    data = b'metadata' * 64
+    blkptr = make_blkptr(data)
+    cache.put((0, 0x1234, 7), blkptr, data)
+    assert cache.writes == 0
+    assert cache.size == 0
+
+
+def test_counters_threaded(tmpdir):
+    cache = DiskCache(str(tmpdir))
+    data = b'metadata' * 64
+    blkptr = make_blkptr(data)
+    cache.put((0, 0, 7), blkptr, data)
+
+    def reader():
+        for i in range(200):
+            cache.get((0, i & 1, 7), blkptr, verifier(blkptr))
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.hits == cache.misses == 400
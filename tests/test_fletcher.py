@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from zfs import util
+
+numpy = pytest.importorskip('numpy')
+
+# lengths straddling util.FLETCHER_BLOCK, so both the full blocks and the tail are covered
+sizes = [0, 16, 512, 4096, 65536 + 16, 1 << 18, (1 << 18) + 4096]
+
+
+def sample(size):
+    rng = random.Random(size)
+    return bytes(rng.getrandbits(8) for _ in range(size))
+
+
+@pytest.mark.parametrize('size', sizes)
+def test_fletcher4_numpy(size):
+    data = sample(size)
+    assert util.fletcher4_numpy(data) == util.fletcher4_python(data)
+
+
+@pytest.mark.parametrize('size', sizes)
+def test_fletcher2_numpy(size):
+    data = sample(size)
+    assert util.fletcher2_numpy(data) == util.fletcher2_python(data)
+
+
+def test_fletcher_wraparound():
+    # all-ones words overflow every running sum many times over
+    data = b'\xff' * (1 << 20)
+    assert util.fletcher4_numpy(data) == util.fletcher4_python(data)
+    assert util.fletcher2_numpy(data) == util.fletcher2_python(data)
+
+
+def test_fletcher_memoryview():
+    data = sample(8192)
+    assert util.fletcher4_numpy(memoryview(data)) == util.fletcher4_python(data)
@@ -0,0 +1,132 @@
+import struct
+
+import pytest
+
+from zfs import arc
+from zfs import compression
+from zfs import ondisk
+from zfs import readcontext
+from zfs import util
+from zfs import vdevs
+from zfs.constants import Checksum, Compression
+
+BIRTH = 9
+
+
+class MemoryDev(vdevs.VDev):
+    # a vdev with no labels, just an allocatable data area
+    def __init__(self) -> None:
+        self.id = 0
+        self.data = bytearray(0x400000)
+        self.reads = 0
+
+    def read(self, offset, size):
+        self.reads += 1
+        offset = self.absolute_offset(offset)
+        return bytes(self.data[offset:offset + size])
+
+    def alloc(self, data: bytes) -> ondisk.dva:
+        data += bytes(-len(data) % 512)
+        dva = ondisk.dva()
+        dva.offset = (len(self.data) - 0x400000) >> 9
+        dva.asize = len(data) >> 9
+        self.data += data
+        return dva
+
+
+def blkptr(dva, data, lsize=None, compress=Compression.OFF):
+    bp = ondisk.Blockptr()
+    bp.dvas = [dva, ondisk.dva(), ondisk.dva()]
+    bp.logical_size = (lsize or len(data)) // 512 - 1
+    bp.physical_size = len(data) // 512 - 1
+    bp.compression = compress
+    bp.checksum_type = Checksum.FLETCHER_4
+    bp.birth = BIRTH
+    bp.checksum = list(util.fletcher4(data))
+    return bp
+
+
+def gang(dev, data, pieces, lsize=None, compress=Compression.OFF, nested=False):
+    '''Store data as a gang block split at pieces, and return a blkptr to it.'''
+    members = []
+    for start, end in zip((0,) + pieces, pieces + (len(data),)):
+        piece = data[start:end]
+        if nested and not members:
+            members.append(gang(dev, piece, (len(piece) // 2,)))
+        else:
+            members.append(blkptr(dev.alloc(piece), piece))
+    while len(members) < 3:
+        # unused slots are holes
+        hole = ondisk.Blockptr()
+        hole.dvas = [ondisk.dva(), ondisk.dva(), ondisk.dva()]
+        hole.checksum = [0, 0, 0, 0]
+        members.append(hole)
+    header = b''.join(member.pack() for member in members) + bytes(88) + struct.pack('<Q', ondisk.GangBlock.MAGIC)
+    dva = dev.alloc(header + bytes(32))
+    dva.gang = 1
+    verifier = (0, dva.offset << 9, BIRTH, 0)
+    checksum = util.sha256(header + struct.pack('<QQQQ', *verifier))
+    start = 0x400000 + (dva.offset << 9)
+    dev.data[start:start + 512] = header + struct.pack('<QQQQ', *checksum)
+    return blkptr(dva, data, lsize, compress)
+
+
+def context(dev):
+    return readcontext.ReadContext({0: dev}, Compression.LZJB, Checksum.FLETCHER_4, 9, set(),
+                                   gang_cache=arc.ARC(1 << 16))
+
+
+def test_gang_block():
+    dev = MemoryDev()
+    data = bytes(range(256)) * 12
+    bp = gang(dev, data, (1024, 2048))
+    assert context(dev).read_block(bp) == data
+
+
+def test_compressed_gang_block():
+    dev = MemoryDev()
+    data = compression.LZJB_VECTOR + bytes(-len(compression.LZJB_VECTOR) % 512)
+    sample = compression.SELF_TEST_SAMPLE
+    bp = gang(dev, data, (512,), lsize=len(sample) + (-len(sample) % 512), compress=Compression.LZJB)
+    assert context(dev).read_block(bp)[:len(sample)] == sample
+
+
+def test_nested_gang_block():
+    dev = MemoryDev()
+    data = bytes(range(256)) * 8
+    bp = gang(dev, data, (1024,), nested=True)
+    assert context(dev).read_block(bp) == data
+
+
+def test_gang_header_cached():
+    dev = MemoryDev()
+    data = bytes(range(256)) * 4
+    bp = gang(dev, data, (512,))
+    ctx = context(dev)
+    assert ctx.read_block(bp) == data
+    reads = dev.reads
+    assert ctx.read_block(bp) == data
+    # only the members are read again
+    assert dev.reads - reads == 2
+
+
+def test_bad_gang_header():
+    dev = MemoryDev()
+    bp = gang(dev, bytes(range(256)) * 4, (512,))
+    header = 0x400000 + (bp.dvas[0].offset << 9)
+    dev.data[header] ^= 1
+    with pytest.raises(ValueError):
+        context(dev).read_block(bp)
+
+
+def test_gang_header_ditto():
+    dev = MemoryDev()
+    data = bytes(range(256)) * 4
+    bp = gang(dev, data, (512,))
+    # a second copy of the header, which is still checksummed against dvas[0]
+    header = 0x400000 + (bp.dvas[0].offset << 9)
+    ditto = dev.alloc(bytes(dev.data[header:header + 512]))
+    ditto.gang = 1
+    bp.dvas[1] = ditto
+    ctx = context(dev)
+    assert ctx.read_gang_header(bp, bp.dvas[1]).pack() == ctx.read_gang_header(bp, bp.dvas[0]).pack()
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from zfs import compression
+from zfs import pipeline
+from zfs.constants import Checksum, Compression
+
+SAMPLE = compression.SELF_TEST_SAMPLE
+
+
+def test_map_keeps_order_and_window():
+    pl = pipeline.Pipeline(workers=4, window=3)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        with lock:
+            running.remove(item)
+        return item * 2
+
+    results = pl.map(work, range(50))
+    assert list(results) == [i * 2 for i in range(50)]
+    assert max(peak) <= 3
+    pl.shutdown()
+
+
+def test_map_cancels_unread_items():
+    pl = pipeline.Pipeline(workers=1, window=4)
+    gate = threading.Event()
+    started = []
+
+    def work(item):
+        started.append(item)
+        if item:
+            gate.wait()
+        return item
+
+    results = pl.map(work, range(10))
+    assert next(results) == 0
+    results.close()
+    gate.set()
+    pl.shutdown()
+    # at most the item the worker had already picked up ran; the rest of the window was cancelled
+    assert started in ([0], [0, 1])
+
+
+@pytest.mark.parametrize('executor', pipeline.EXECUTORS)
+def test_decode(executor):
+    pl = pipeline.Pipeline(workers=2, executor=executor)
+    args = ([0, 0, 0, 0], Checksum.OFF, False, Compression.LZJB, len(SAMPLE), None, None)
+    assert pl.decode(compression.LZJB_VECTOR, *args) == (SAMPLE, True)
+    out = bytearray(len(SAMPLE))
+    assert pl.decode(memoryview(compression.LZJB_VECTOR), *args, out=memoryview(out)) == (len(SAMPLE), True)
+    assert out == SAMPLE
+    pl.shutdown()
+
+
+def test_bad_checksum_returns_raw_data():
+    pl = pipeline.Pipeline(workers=1)
+    args = ([1, 2, 3, 4], Checksum.SHA256, True, Compression.LZJB, len(SAMPLE), None, None)
+    assert pl.decode(compression.LZJB_VECTOR, *args) == (compression.LZJB_VECTOR, False)
+    pl.shutdown()
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        pipeline.Pipeline(executor='fiber')
@@ -1,3 +1,7 @@
+import os
+
+import pytest
+
 from fixtures import zpool
 
 
@@ -12,3 +16,23 @@ def test_permissions(zpool):
     directory = zpool.open('/d1/d2/d3')
     d = directory['d']
     assert d.attrs['ZPL_MODE'].perms == 0o1765
+
+
+def test_data_extents(zpool):
+    zeros = zpool.open('/zeros')
+    extents = zeros.data_extents()
+    assert extents[0][0] == 0
+    assert sum(length for _, length, _ in extents) == zeros.attrs['ZPL_SIZE']
+    assert all(a[0] + a[1] == b[0] for a, b in zip(extents, extents[1:]))
+    for offset, length, is_data in extents:
+        if not is_data:
+            assert zeros.read_range(offset, length) == bytes(length)
+
+
+def test_seek_hole_and_data(zpool):
+    c = zpool.open('/d1/d2/d3/c')
+    with c.open() as f:
+        assert f.seek(0, os.SEEK_DATA) == 0
+        assert f.seek(0, os.SEEK_HOLE) == c.attrs['ZPL_SIZE']
+        with pytest.raises(OSError):
+            f.seek(c.attrs['ZPL_SIZE'], os.SEEK_DATA)
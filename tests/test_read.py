@@ -1,6 +1,11 @@
 import pytest
 
-from fixtures import zpool
+from concurrent.futures import ThreadPoolExecutor
+
+from zfs import blockdev, filedev, pool
+from zfs.constants import Verify
+
+from fixtures import zpool, feature_pools, fixture
 
 
 def test_read_file(zpool):
@@ -35,3 +40,105 @@ def test_read_fatzap_directory(zpool):
     assert 'second_long_nameAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA' in dir_ents
     assert 'third_long_nameAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA' in dir_ents
     assert 'fourth_long_nameAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA' in dir_ents
+
+
+def test_read_file_range(zpool):
+    zeros = zpool.open('/zeros')
+    assert zeros.read_range(4000, 200) == b'\0' * 97
+    assert zeros.read_range(5000, 10) == b''
+    c = zpool.open('/d1/d2/d3/c')
+    assert c.read_range(1, 10) == b'\n'
+
+
+def test_read_range_across_blocks():
+    large_blocks = pool.Pool(feature_pools[b'org.open-zfs:large_block'])
+    words5 = large_blocks.open('/words5')
+    data = words5.read()
+    assert words5.read_range(200000, 150000) == data[200000:350000]
+
+
+def test_open_file_stream():
+    large_blocks = pool.Pool(feature_pools[b'org.open-zfs:large_block'])
+    words5 = large_blocks.open('/words5')
+    data = words5.read()
+    with words5.open() as f:
+        assert f.read(1000) == data[:1000]
+        f.seek(300000)
+        assert f.read() == data[300000:]
+        f.seek(-10, 2)
+        assert f.read(100) == data[-10:]
+
+
+def test_concurrent_range_reads():
+    large_blocks = pool.Pool(feature_pools[b'org.open-zfs:large_block'])
+    words5 = large_blocks.open('/words5')
+    data = words5.read()
+    offsets = range(0, len(data), 4096)
+    with ThreadPoolExecutor(8) as executor:
+        chunks = list(executor.map(lambda offset: words5.read_range(offset, 4096), offsets))
+    assert b''.join(chunks) == data
+
+
+def test_read_file_mmap():
+    zp = pool.Pool([filedev.MmapDev(fixture('simple'))])
+    assert zp.read_file('/d1/d2/d3/c') == b'c\n'
+    assert zp.read_file('zeros') == b'\0' * 4097
+
+
+def test_read_file_blockdev():
+    zp = pool.Pool([blockdev.BlockDev(fixture('simple'), direct=True, readahead=1 << 20)])
+    assert zp.read_file('/d1/d2/d3/c') == b'c\n'
+    assert zp.read_file('zeros') == b'\0' * 4097
+
+
+@pytest.mark.parametrize('policy', list(Verify))
+def test_verify_policies(policy):
+    zp = pool.Pool([filedev.FileDev(fixture('simple'))], cache_size=0, verify=policy)
+    assert zp.read_file('/d1/d2/d3/c') == b'c\n'
+    assert zp.read_file('/d1/d2/d3/c') == b'c\n'
+    if policy in (Verify.ALWAYS, Verify.ONCE):
+        assert len(zp.verified) > 0
+    elif policy == Verify.OFF:
+        assert len(zp.verified) == 0
+
+
+def test_forced_verification_replaces_unverified_blocks():
+    zp = pool.Pool([filedev.FileDev(fixture('simple'))], verify=Verify.OFF)
+    c = zp.open('/d1/d2/d3/c')
+    assert c.read() == b'c\n'
+    assert len(zp.verified) == 0
+    assert zp.context(verify=Verify.ALWAYS).read_dnode(c.dnode)[:2] == b'c\n'
+    assert len(zp.verified) > 0
+
+
+def test_read_range_into():
+    large_blocks = pool.Pool(feature_pools[b'org.open-zfs:large_block'])
+    words5 = large_blocks.open('/words5')
+    data = words5.read()
+    buffer = bytearray(300000)
+    assert words5.read_range_into(100000, buffer) == 300000
+    assert buffer == data[100000:400000]
+    assert words5.read_range_into(len(data) - 10, buffer) == 10
+    assert buffer[:10] == data[-10:]
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_pipelined_read(executor):
+    with pool.Pool(feature_pools[b'org.open-zfs:large_block'], workers=4, executor=executor) as large_blocks:
+        words5 = large_blocks.open('/words5')
+        serial = pool.Pool(feature_pools[b'org.open-zfs:large_block']).open('/words5')
+        assert words5.read_range(0, 1 << 22) == serial.read_range(0, 1 << 22)
+    assert large_blocks.pipeline is None
+
+
+def test_walk_dnode():
+    large_blocks = pool.Pool(feature_pools[b'org.open-zfs:large_block'])
+    words5 = large_blocks.open('/words5')
+    context = large_blocks.context()
+    blocks = list(context.walk_dnode(words5.dnode))
+    assert [block_id for block_id, _, _ in blocks] == list(range(words5.dnode.max_block_id + 1))
+    indirect_hits = large_blocks.indirect_cache.stats()['hits']
+    assert [bp.birth for _, _, bp in context.walk_dnode(words5.dnode)] == [bp.birth for _, _, bp in blocks]
+    if words5.dnode.indirect_levels > 1:
+        assert large_blocks.indirect_cache.stats()['hits'] > indirect_hits
+    assert words5.read() == words5.read_range(0, words5.attrs['ZPL_SIZE'])
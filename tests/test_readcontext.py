@@ -0,0 +1,112 @@
+import types
+
+from zfs import arc
+from zfs import objectset
+from zfs import ondisk
+from zfs import readcontext
+from zfs import vdevs
+from zfs.constants import Checksum, Compression, ObjectType
+from zfs.posix import posix_file
+
+from test_gang import MemoryDev, blkptr
+
+
+def context(dev, **kwargs):
+    return readcontext.ReadContext({0: dev}, Compression.LZJB, Checksum.FLETCHER_4, 9, set(), **kwargs)
+
+
+def dnode(blkptrs, block_size):
+    dn = ondisk.DNode()
+    dn.node_type = ObjectType.PLAIN_FILE_CONTENTS
+    dn.indirect_blockshift = 17
+    dn.indirect_levels = 1
+    dn.data_sectors = block_size // 512
+    dn.max_block_id = len(blkptrs) - 1
+    dn.blkptr = blkptrs
+    return dn
+
+
+def test_whole_block_reads_are_cached():
+    dev = MemoryDev()
+    blocks = [bytes([i]) * 1024 for i in (1, 2)]
+    dn = dnode([blkptr(dev.alloc(block), block) for block in blocks], 1024)
+    cache = arc.ARC(1 << 20)
+    ctx = context(dev, cache=cache)
+    for _ in range(5):
+        assert ctx.read_dnode(dn) == b''.join(blocks)
+    assert dev.reads == 2
+    assert cache.stats()['hits'] == 8
+
+
+def test_dnodes_read_through_cache():
+    dev = MemoryDev()
+    dnodes = []
+    for i in range(32):
+        dn = dnode([], 512)
+        dn.max_block_id = i
+        dnodes.append(dn.pack().ljust(512, b'\0'))
+    block = b''.join(dnodes)
+    meta_dnode = dnode([blkptr(dev.alloc(block), block)], len(block))
+    # ObjectSet only needs a pool to read the meta dnode with
+    cache = arc.ARC(1 << 20)
+    objset = objectset.ObjectSet(context(dev, cache=cache), types.SimpleNamespace(meta_dnode=meta_dnode))
+    assert [objset.get_dnode(i).max_block_id for i in range(32)] == list(range(32))
+    assert dev.reads == 1
+    assert len(cache) == 1
+    # each dnode holds on to its own slot, not the whole block
+    assert all(len(dn._source[0]) == 512 for dn in objset.dnodes.values())
+
+
+def test_trailing_hole_reads_as_zeros():
+    dev = MemoryDev()
+    block = b'x' * 1024
+    # a file truncated up past its last block
+    f = posix_file.File.__new__(posix_file.File)
+    f.dataset = types.SimpleNamespace(pool=context(dev))
+    f.dnode = dnode([blkptr(dev.alloc(block), block)], 1024)
+    f.attrs = {'ZPL_SIZE': 4000}
+    assert f.read() == block + bytes(4000 - 1024)
+    assert f.read_range(1000, 100) == b'x' * 24 + bytes(76)
+    assert f.read_range(3000, 2000) == bytes(1000)
+    with f.open() as stream:
+        stream.seek(1020)
+        assert stream.read() == b'x' * 4 + bytes(4000 - 1024)
+
+
+def test_indirect_blocks_cached_once():
+    dev = MemoryDev()
+    blocks = [bytes([i]) * 1024 for i in (1, 2)]
+    l0 = [blkptr(dev.alloc(block), block) for block in blocks]
+    indirect = b''.join(bp.pack() for bp in l0).ljust(1024, b'\0')
+    l1 = blkptr(dev.alloc(indirect), indirect)
+    l1.level = 1
+    dn = dnode([l1], 1024)
+    dn.indirect_blockshift = 10
+    dn.indirect_levels = 2
+    dn.max_block_id = 1
+    cache = arc.ARC(1 << 20)
+    indirect_cache = arc.ARC(1 << 20)
+    ctx = context(dev, cache=cache, indirect_cache=indirect_cache)
+    assert ctx.read_dnode(dn) == b''.join(blocks)
+    key = (0, l1.dvas[0].offset, l1.birth)
+    assert key in indirect_cache
+    assert key not in cache
+    assert len(cache) == 2
+
+
+def test_uncompressed_blocks_read_into_buffer():
+    dev = MemoryDev()
+    views = []
+    dev.readv = lambda offset, buffers: views.extend(buffers) or vdevs.VDev.readv(dev, offset, buffers)
+    block = bytes(range(256)) * 4
+    bp = blkptr(dev.alloc(block), block)
+    out = memoryview(bytearray(2048))
+    ctx = context(dev)
+    assert ctx.read_block_into(bp, out) == 1024
+    assert out[:1024] == block
+    # the vdev filled out itself
+    assert [view.obj for view in views] == [out.obj]
+    assert len(ctx.verified) == 1
+    bp.checksum = [0, 0, 0, 0]
+    assert ctx.read_block_into(bp, out) == 1024
+    assert len(ctx.verified) == 1
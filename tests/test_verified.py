@@ -0,0 +1,25 @@
+from zfs.verified import VerifiedSet
+
+
+def test_membership():
+    verified = VerifiedSet()
+    verified.add((0, 0x4000, 12))
+    assert (0, 0x4000, 12) in verified
+    assert (0, 0x4000, 13) not in verified
+    assert (1, 0x4000, 12) not in verified
+
+
+def test_packed_keys_are_distinct():
+    # the fields must not bleed into each other, even at their limits
+    keys = [(0, (1 << 63) - 1, 1), (1, 0, 1), ((1 << 32) - 1, 0, 0), (0, 0, 1 << 40)]
+    assert len({VerifiedSet.pack(key) for key in keys}) == len(keys)
+
+
+def test_full_set_is_emptied():
+    verified = VerifiedSet(max_entries=4)
+    for offset in range(4):
+        verified.add((0, offset, 1))
+    assert len(verified) == 4
+    verified.add((0, 4, 1))
+    assert len(verified) == 1
+    assert (0, 4, 1) in verified
@@ -0,0 +1,145 @@
+import logging
+import threading
+
+from collections import OrderedDict
+from typing import Any
+from typing import Dict
+from typing import Hashable
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ARC(object):
+    '''A byte-bounded adaptive replacement cache.
+
+    Entries seen once live in the recency list, entries seen again move to the
+    frequency list. Keys evicted from either list are remembered (without
+    their data) in a ghost list; a miss that hits a ghost list shifts the
+    target size of the recency list towards whichever list would have kept it.
+    '''
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.target = 0  # target size of the recency list, in bytes
+        self.recent = OrderedDict()
+        self.frequent = OrderedDict()
+        self.recent_ghosts = OrderedDict()
+        self.frequent_ghosts = OrderedDict()
+        self.recent_bytes = 0
+        self.frequent_bytes = 0
+        self.recent_ghost_bytes = 0
+        self.frequent_ghost_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.recent) + len(self.frequent)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.recent or key in self.frequent
+
+    @property
+    def size(self) -> int:
+        return self.recent_bytes + self.frequent_bytes
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            if key in self.recent:
+                value, size = self.recent.pop(key)
+                self.recent_bytes -= size
+                self.frequent[key] = (value, size)
+                self.frequent_bytes += size
+            elif key in self.frequent:
+                self.frequent.move_to_end(key)
+                value, size = self.frequent[key]
+            else:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: int = None) -> None:
+        if size is None:
+            size = len(value)
+        if size > self.max_bytes or not self.max_bytes:
+            return
+        with self.lock:
+            if key in self.recent or key in self.frequent:
+                return
+            if key in self.recent_ghosts:
+                ratio = max(1, self.frequent_ghost_bytes // max(self.recent_ghost_bytes, 1))
+                self.target = min(self.max_bytes, self.target + ratio * size)
+                self.recent_ghost_bytes -= self.recent_ghosts.pop(key)
+                self._make_room(size, in_frequent_ghosts=False)
+                self.frequent[key] = (value, size)
+                self.frequent_bytes += size
+            elif key in self.frequent_ghosts:
+                ratio = max(1, self.recent_ghost_bytes // max(self.frequent_ghost_bytes, 1))
+                self.target = max(0, self.target - ratio * size)
+                self.frequent_ghost_bytes -= self.frequent_ghosts.pop(key)
+                self._make_room(size, in_frequent_ghosts=True)
+                self.frequent[key] = (value, size)
+                self.frequent_bytes += size
+            else:
+                self._make_room(size, in_frequent_ghosts=False)
+                self.recent[key] = (value, size)
+                self.recent_bytes += size
+            self._trim_ghosts()
+
+    def discard(self, key: Hashable) -> None:
+        with self.lock:
+            if key in self.recent:
+                _, size = self.recent.pop(key)
+                self.recent_bytes -= size
+            elif key in self.frequent:
+                _, size = self.frequent.pop(key)
+                self.frequent_bytes -= size
+
+    def clear(self) -> None:
+        with self.lock:
+            for entries in (self.recent, self.frequent, self.recent_ghosts, self.frequent_ghosts):
+                entries.clear()
+            self.recent_bytes = self.frequent_bytes = 0
+            self.recent_ghost_bytes = self.frequent_ghost_bytes = 0
+            self.target = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'recent_target': self.target,
+        }
+
+    def _make_room(self, size: int, in_frequent_ghosts: bool) -> None:
+        while self.recent_bytes + self.frequent_bytes + size > self.max_bytes:
+            self._replace(in_frequent_ghosts)
+
+    def _replace(self, in_frequent_ghosts: bool) -> None:
+        recent_over = self.recent_bytes > self.target or (in_frequent_ghosts and self.recent_bytes == self.target)
+        if self.recent and (recent_over or not self.frequent):
+            key, (_, size) = self.recent.popitem(last=False)
+            self.recent_bytes -= size
+            self.recent_ghosts[key] = size
+            self.recent_ghost_bytes += size
+        else:
+            key, (_, size) = self.frequent.popitem(last=False)
+            self.frequent_bytes -= size
+            self.frequent_ghosts[key] = size
+            self.frequent_ghost_bytes += size
+        self.evictions += 1
+
+    def _trim_ghosts(self) -> None:
+        while self.recent_ghosts and self.recent_bytes + self.recent_ghost_bytes > self.max_bytes:
+            _, size = self.recent_ghosts.popitem(last=False)
+            self.recent_ghost_bytes -= size
+        while self.frequent_ghosts and self.size + self.recent_ghost_bytes + self.frequent_ghost_bytes > 2 * self.max_bytes:
+            _, size = self.frequent_ghosts.popitem(last=False)
+            self.frequent_ghost_bytes -= size
@@ -0,0 +1,86 @@
+import logging
+import mmap
+import os
+import threading
+
+from . import vdevs
+
+logger = logging.getLogger(__name__)
+
+# large enough for both 512 byte and 4K sector devices before the label is known
+DEFAULT_ALIGNMENT = 4096
+
+
+class BlockDev(vdevs.VDev):
+    '''A vdev backed by a raw block device, like /dev/sdb1.
+    Regular files work too, which is handy for testing.
+
+    Keyword Arguments:
+        direct (bool): open the device with O_DIRECT, bypassing the page cache.
+            Reads are widened to ``alignment``-aligned offsets and lengths and
+            land in page-aligned buffers, as O_DIRECT requires.
+        readahead (int): size in bytes of the window read whenever a read
+            falls outside the previous window. Sequential reads are then served
+            from the window; 0 disables it. Without ``direct``, the kernel's own
+            readahead is turned off and each window is dropped from the page
+            cache once it is read, so long extractions don't evict everything else.
+        alignment (int): the I/O alignment for ``direct``. It is raised to the
+            pool's ashift once the label has been read.
+    '''
+
+    def __init__(self, path, label=None, txg=None, direct=False, readahead=0, alignment=DEFAULT_ALIGNMENT):
+        flags = os.O_RDONLY
+        if direct:
+            flags |= os.O_DIRECT
+        self.path = path
+        self.fd = os.open(path, flags)
+        self.direct = direct
+        self.readahead = readahead
+        self.alignment = alignment
+        # lseek works for block devices, where fstat reports a size of 0
+        self.size = os.lseek(self.fd, 0, os.SEEK_END)
+        self.window_offset = 0
+        self.window = b''
+        self.window_lock = threading.Lock()
+        self.fadvise = readahead and not direct and hasattr(os, 'posix_fadvise')
+        if self.fadvise:
+            os.posix_fadvise(self.fd, 0, 0, os.POSIX_FADV_RANDOM)
+        super(BlockDev, self).__init__(label, txg)
+        self.alignment = max(self.alignment, 1 << self.label[b'vdev_tree'][b'ashift'])
+
+    def device_size(self) -> int:
+        return self.size
+
+    def read(self, offset, size):
+        start = self.absolute_offset(offset)
+        if not self.readahead:
+            return self._pread(start, size)
+        with self.window_lock:
+            window_start = start - self.window_offset
+            if 0 <= window_start and start + size <= self.window_offset + len(self.window):
+                return self.window[window_start:window_start + size]
+            data = self._pread(start, max(size, self.readahead))
+            self.window_offset = start
+            self.window = data
+            if self.fadvise:
+                os.posix_fadvise(self.fd, start, len(data), os.POSIX_FADV_DONTNEED)
+            return data[:size]
+
+    def _pread(self, start: int, size: int) -> bytes:
+        if not self.direct:
+            return os.pread(self.fd, size, start)
+        if size <= 0:
+            return b''
+        aligned_start = start - start % self.alignment
+        aligned_end = -(-(start + size) // self.alignment) * self.alignment
+        # anonymous maps are page aligned, which satisfies O_DIRECT's buffer alignment
+        buf = mmap.mmap(-1, aligned_end - aligned_start)
+        try:
+            length = os.preadv(self.fd, [buf], aligned_start)
+            skip = start - aligned_start
+            return buf[skip:min(skip + size, length)]
+        finally:
+            buf.close()
+
+    def close(self) -> None:
+        os.close(self.fd)
@@ -0,0 +1,289 @@
+'''Decompression codecs, keyed by `Compression`.
+
+Each codec can have several backends: the pure Python decoders that ship
+with zfsp, and optional native modules. The first time a codec is used it
+runs every backend that imports over a known test vector and keeps the
+fastest one that decodes it correctly.
+'''
+import logging
+import struct
+import threading
+import time
+import zlib
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .constants import Compression
+
+logger = logging.getLogger(__name__)
+
+Decompressor = Callable[[bytes, int], bytes]
+# decodes into a writable buffer and returns the number of bytes written
+IntoDecompressor = Callable[[bytes, Any], int]
+
+# what the test vectors below decode to
+SELF_TEST_SAMPLE = b''.join(b'%d: zfsp %s%s\n' % (i, b'ab' * (i % 7), b'\0' * (i % 5 * 9)) for i in range(32))
+
+LZJB_VECTOR = bytes.fromhex(
+    '00303a207a66737020440a31100961620014010a8e3218142016141e000a33201fbb44211c2a34282a682c1c35353035'
+    '3061620a363813204c0a37e7101e184318090a38101b202f181db918090a39182668281c3131153fe4616204020a311d'
+    '4604102046fc0a31254d301d20512d545428203127155b181360090a311d540a3165254d0014010a311546547c0a8e31'
+    '1d4d5424144e000a3125549b782f1c38322d5a0c3a0a321560cf20291d58181518090a3225501817793c090a3215480c'
+    '6a3c223c120ae6321d4e0c360a3225540c141838fc0a322d5a301f2028156018133c090c0a321d583c1e000000000000'
+    '00000000000000000000000000000a3300303a207a6673702000616261620a33313a00207a6673702061620061626162'
+    '000000000000000000000a'
+)
+
+# ZFS prefixes LZ4 blocks with their compressed length, big-endian
+LZ4_VECTOR = bytes.fromhex(
+    '0000014ea3303a207a667370200a310900346162000100250a321400071600050200270a331f000f210001050200290a'
+    '342a000f2c000a0502002b0a3535004d61620a361300074c00230a371e00054300050200230a381b00072f000e020025'
+    '0a3926000f28000a050200240a313f0103a00016314601020200072b00084d01020200051d000502002a0a3154010202'
+    '00051f000e0200240a315b010e1c000e0200260a315401280a314d01052c00240a3146010f7c0005260a314d01020200'
+    '053d000e0200280a3154010202000e26000e02002a0a325a01020200240a326001053200260a32580105150005020028'
+    '0a3250010517000e0200240a324801026a000e22000e0200260a324e01020200280a3254010202000538002a0a325a01'
+    '020200051f00050200240a3260010513000e0200260a3258010e1e000e0200280a335001240a33480107850050000000'
+    '000a'
+)
+
+ZLE_VECTOR = bytes.fromhex(
+    '12303a207a667370200a313a207a667370206162480c0a323a207a6673702061626162510e0a333a207a667370206162'
+    '616261625a100a343a207a66737020616261626162616263270a353a207a66737020616261626162616261620a363a20'
+    '7a6673702061626162616261626162616248080a373a207a66737020510a0a383a207a6673702061625a0c0a393a207a'
+    '667370206162616263210a31303a207a667370206162616261620a31313a207a66737020616261626162616248130a31'
+    '323a207a667370206162616261626162616251150a31333a207a667370206162616261626162616261625a090a31343a'
+    '207a6673702063190a31353a207a6673702061620a31363a207a6673702061626162480f0a31373a207a667370206162'
+    '6162616251110a31383a207a6673702061626162616261625a130a31393a207a6673702061626162616261626162631f'
+    '0a32303a207a667370206162616261626162616261620a32313a207a66737020480b0a32323a207a667370206162510d'
+    '0a32333a207a66737020616261625a0f0a32343a207a6673702061626162616263250a32353a207a6673702061626162'
+    '616261620a32363a207a667370206162616261626162616248150a32373a207a66737020616261626162616261626162'
+    '51090a32383a207a667370205a0b0a32393a207a667370206162631d0a33303a207a66737020616261620a33313a207a'
+    '6673702061626162616248000a'
+)
+
+SELF_TEST_ROUNDS = 5
+
+
+class Backend(object):
+    def __init__(self, name: str, loader: Callable[[], Decompressor],
+                 into_loader: Callable[[], IntoDecompressor] = None) -> None:
+        self.name = name
+        self.loader = loader
+        self.into_loader = into_loader
+        self.decompress = None  # type: Optional[Decompressor]
+        self.decompress_into = None  # type: Optional[IntoDecompressor]
+        self.error = None  # type: Optional[str]
+        self.seconds = None  # type: Optional[float]
+
+    def __repr__(self):
+        return '<Backend {}>'.format(self.name)
+
+
+class Codec(object):
+    def __init__(self, name: str, vectors: List[Tuple[bytes, int, bytes]]) -> None:
+        self.name = name
+        self.vectors = vectors
+        self.backends = []  # type: List[Backend]
+        self._active = None  # type: Optional[Backend]
+        self.lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Decompressor],
+                 into_loader: Callable[[], IntoDecompressor] = None) -> None:
+        '''Add a backend. `loader` returns its decompress(data, size) function,
+        or raises ImportError if the backend isn't installed. Backends that can
+        decode into a caller's buffer also pass `into_loader`, which returns
+        their decompress_into(data, out) function.'''
+        with self.lock:
+            self.backends.append(Backend(name, loader, into_loader))
+            self._active = None
+
+    @property
+    def active(self) -> Optional[Backend]:
+        if self._active is None:
+            with self.lock:
+                if self._active is None:
+                    self._active = self.self_test()
+        return self._active
+
+    def self_test(self) -> Optional[Backend]:
+        best = None
+        for backend in self.backends:
+            backend.error = backend.seconds = None
+            try:
+                backend.decompress = backend.loader()
+                if backend.into_loader is not None:
+                    backend.decompress_into = backend.into_loader()
+            except ImportError as e:
+                backend.error = 'not installed ({})'.format(e)
+                continue
+            try:
+                start = time.perf_counter()
+                for _ in range(SELF_TEST_ROUNDS):
+                    for data, size, expected in self.vectors:
+                        if backend.decompress(data, size) != expected:
+                            raise ValueError('wrong output')
+                backend.seconds = time.perf_counter() - start
+                if backend.decompress_into is not None:
+                    for data, size, expected in self.vectors:
+                        out = bytearray(size)
+                        if backend.decompress_into(data, memoryview(out)) != size or out != expected:
+                            raise ValueError('wrong output from decompress_into')
+            except Exception as e:
+                backend.error = 'failed self-test ({!r})'.format(e)
+                logger.warning('{} backend {} {}'.format(self.name, backend.name, backend.error))
+                continue
+            if best is None or backend.seconds < best.seconds:
+                best = backend
+        if best is None:
+            logger.error('no working backend for {}'.format(self.name))
+        else:
+            logger.debug('using {} for {}'.format(best.name, self.name))
+        return best
+
+    def decompress(self, data: bytes, size: int) -> bytes:
+        backend = self.active
+        if backend is None:
+            raise ValueError('no working {} backend'.format(self.name))
+        return backend.decompress(data, size)
+
+    def decompress_into(self, data: bytes, out) -> int:
+        backend = self.active
+        if backend is None:
+            raise ValueError('no working {} backend'.format(self.name))
+        if backend.decompress_into is not None:
+            return backend.decompress_into(data, out)
+        result = backend.decompress(data, len(out))
+        length = min(len(result), len(out))
+        out[:length] = memoryview(result)[:length]
+        return length
+
+
+codecs = {}  # type: Dict[Compression, Codec]
+
+
+def register_codec(codec: Codec, *modes: Compression) -> Codec:
+    for mode in modes:
+        codecs[mode] = codec
+    return codec
+
+
+def get(mode: Compression) -> Codec:
+    try:
+        return codecs[mode]
+    except KeyError:
+        raise ValueError(mode)
+
+
+def decompress(data: bytes, mode: Compression, size: int) -> bytes:
+    return get(mode).decompress(data, size)
+
+
+def decompress_into(data: bytes, mode: Compression, out) -> int:
+    return get(mode).decompress_into(data, out)
+
+
+def report() -> List[Tuple[Codec, List[Compression]]]:
+    '''Each distinct codec with the compression modes it handles.'''
+    seen = {}  # type: Dict[int, Tuple[Codec, List[Compression]]]
+    for mode, codec in sorted(codecs.items()):
+        seen.setdefault(id(codec), (codec, []))[1].append(mode)
+    return list(seen.values())
+
+
+def lz4_payload(data: bytes) -> bytes:
+    length = struct.unpack('>I', data[:4])[0]
+    return data[4:length + 4]
+
+
+def _rlzjb() -> Decompressor:
+    from . import rlzjb
+    return lambda data, size: bytes(rlzjb.decompress(data, size))
+
+
+def _python_lzjb() -> Decompressor:
+    from . import lzjb
+    return lambda data, size: bytes(lzjb.decompress(data, size))
+
+
+def _python_lzjb_into() -> IntoDecompressor:
+    from . import lzjb
+    return lzjb.decompress_into
+
+
+def _lz4() -> Decompressor:
+    import lz4.block
+
+    def decompress(data: bytes, size: int) -> bytes:
+        return lz4.block.decompress(lz4_payload(data), uncompressed_size=size)
+    return decompress
+
+
+def _python_lz4() -> Decompressor:
+    from . import pylz4
+    return lambda data, size: pylz4.decompress(lz4_payload(data), size)
+
+
+def _python_lz4_into() -> IntoDecompressor:
+    from . import pylz4
+    return lambda data, out: pylz4.decompress_into(lz4_payload(data), out)
+
+
+def _python_zle() -> Decompressor:
+    from . import zle
+    return zle.decompress
+
+
+def _python_zle_into() -> IntoDecompressor:
+    from . import zle
+    return zle.decompress_into
+
+
+def _zlib() -> Decompressor:
+    return lambda data, size: zlib.decompress(data)[:size]
+
+
+def _zlib_into() -> IntoDecompressor:
+    def decompress_into(data: bytes, out) -> int:
+        # max_length stops zlib from producing anything past the end of out
+        chunk = zlib.decompressobj().decompress(data, len(out))
+        out[:len(chunk)] = chunk
+        return len(chunk)
+    return decompress_into
+
+
+def _isal() -> Decompressor:
+    from isal import isal_zlib
+    return lambda data, size: isal_zlib.decompress(data)[:size]
+
+
+lzjb = register_codec(
+    Codec('lzjb', [(LZJB_VECTOR, len(SELF_TEST_SAMPLE), SELF_TEST_SAMPLE)]),
+    Compression.ON, Compression.LZJB,
+)
+lzjb.register('rlzjb', _rlzjb)
+lzjb.register('python', _python_lzjb, _python_lzjb_into)
+
+lz4 = register_codec(
+    Codec('lz4', [(LZ4_VECTOR, len(SELF_TEST_SAMPLE), SELF_TEST_SAMPLE)]),
+    Compression.LZ4,
+)
+lz4.register('lz4', _lz4)
+lz4.register('python', _python_lz4, _python_lz4_into)
+
+gzip = register_codec(
+    Codec('gzip', [(zlib.compress(SELF_TEST_SAMPLE, 6), len(SELF_TEST_SAMPLE), SELF_TEST_SAMPLE)]),
+    *(mode for mode in Compression if mode.name.startswith('GZIP_'))
+)
+gzip.register('zlib', _zlib, _zlib_into)
+gzip.register('isal', _isal)
+
+zle = register_codec(
+    Codec('zle', [(ZLE_VECTOR, len(SELF_TEST_SAMPLE), SELF_TEST_SAMPLE)]),
+    Compression.ZLE,
+)
+zle.register('python', _python_zle, _python_zle_into)
@@ -47,6 +47,14 @@ class TryConfig(enum.Enum):
     read_all_dvas = True
 
 
+class Verify(enum.Enum):
+    ALWAYS = 'always'      # every block read from a vdev
+    ONCE = 'once'          # each (vdev, offset, birth) once per pool
+    METADATA = 'metadata'  # indirect blocks and everything but file and zvol data
+    SAMPLED = 'sampled'    # a random fraction of blocks
+    OFF = 'off'
+
+
 class ObjectType(enum.IntEnum):
     NONE = 0
     OBJECT_DIRECTORY = 1         # ZAP
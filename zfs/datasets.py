@@ -22,14 +22,18 @@ class Dataset(object):
         self.properties = objset[dsl_dir.props_zap]
         self._snapshots = None
         self._snapshot_names = None
+        self._child_datasets = None
 
         objset_block = self.pool.read_block(self.dsl_dataset.bp)
         self.objectset = objectset.ObjectSet.from_block(self.pool, objset_block, dataset=self)
 
     @property
     def child_datasets(self) -> 'ChildDatasets':
-        children = self.parent_objectset[self.dsl_dir.child_dir_zap]
-        return ChildDatasets(children, self, self.parent_objectset, path=self.path)
+        # kept so resolved children are reused across lookups
+        if self._child_datasets is None:
+            children = self.parent_objectset[self.dsl_dir.child_dir_zap]
+            self._child_datasets = ChildDatasets(children, self, self.parent_objectset, path=self.path)
+        return self._child_datasets
 
     @property
     def snapshot_names(self) -> Dict:
@@ -47,7 +51,7 @@ class Dataset(object):
                     self.pool,
                     self.dsl_dir,
                     self.parent_objectset,
-                    self.parent_objectset.objset[index],
+                    self.parent_objectset.get_dnode(index),
                     path=self.path+'@'+name
                 )
             self._snapshots = snapshots
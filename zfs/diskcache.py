@@ -0,0 +1,164 @@
+import logging
+import os
+import tempfile
+import threading
+
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+from . import ondisk
+
+from .constants import Checksum, ObjectType
+
+logger = logging.getLogger(__name__)
+
+DATA_TYPES = (ObjectType.PLAIN_FILE_CONTENTS, ObjectType.ZVOL)
+
+DEFAULT_MAX_BYTES = 1 << 30
+# once over budget, evict down to this fraction of it so the next few writes don't rescan
+LOW_WATER = 7 / 8
+TEMP_PREFIX = '.tmp-'
+
+
+class DiskCache(object):
+    '''A persistent block cache in a local directory, kept between runs.
+
+    Blocks are stored in their on-disk (compressed) form, named by DVA, birth
+    txg and checksum. Every hit is verified against the block pointer's
+    checksum before it is returned, and entries that fail are deleted, so a
+    stale or damaged cache can cost a vdev read but never return wrong data.
+
+    The directory is kept under max_bytes by deleting the least recently used
+    entries; hits bump an entry's mtime, since atime is often not updated.
+    '''
+
+    def __init__(self, path: str, metadata_only: bool = True, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path = path
+        self.metadata_only = metadata_only
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.writes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.size = sum(size for _, _, size in self._entries())
+
+    def wants(self, blkptr: ondisk.Blockptr) -> bool:
+        # without a checksum there is no way to validate an entry later
+        if blkptr.checksum_type == Checksum.OFF:
+            return False
+        if self.metadata_only:
+            return blkptr.level > 0 or blkptr.object_type not in DATA_TYPES
+        return True
+
+    def filename(self, key: Tuple[int, int, int], blkptr: ondisk.Blockptr) -> str:
+        vdev, offset, birth = key
+        checksum = ''.join('{:016x}'.format(c) for c in blkptr.checksum)
+        name = '{}-{:x}-{}-{}'.format(vdev, offset, birth, checksum)
+        return os.path.join(self.path, checksum[-2:], name)
+
+    def get(self, key: Tuple[int, int, int], blkptr: ondisk.Blockptr,
+            verify: Callable[[bytes], bool]) -> Optional[bytes]:
+        if not self.wants(blkptr):
+            return None
+        filename = self.filename(key, blkptr)
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        if not verify(data):
+            logger.warning('discarding cached block {} with a bad checksum'.format(filename))
+            with self.lock:
+                self.rejected += 1
+                self._remove(filename)
+            return None
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: Tuple[int, int, int], blkptr: ondisk.Blockptr, data: bytes) -> None:
+        if not self.wants(blkptr) or len(data) > self.max_bytes:
+            return
+        filename = self.filename(key, blkptr)
+        directory = os.path.dirname(filename)
+        temp_name = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            try:
+                replaced = os.path.getsize(filename)
+            except OSError:
+                replaced = 0
+            # readers only ever see complete files
+            os.replace(temp_name, filename)
+        except OSError:
+            logger.exception('failed to write cached block {}'.format(filename))
+            if temp_name and os.path.exists(temp_name):
+                os.remove(temp_name)
+            return
+        with self.lock:
+            self.writes += 1
+            self.size += len(data) - replaced
+            if self.size > self.max_bytes:
+                self._evict(int(self.max_bytes * LOW_WATER))
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'rejected': self.rejected,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _entries(self) -> Iterator[Tuple[float, str, int]]:
+        for directory, _, names in os.walk(self.path):
+            for name in names:
+                if name.startswith(TEMP_PREFIX):
+                    continue
+                filename = os.path.join(directory, name)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                yield st.st_mtime, filename, st.st_size
+
+    def _remove(self, filename: str) -> None:
+        try:
+            size = os.path.getsize(filename)
+            os.remove(filename)
+        except OSError:
+            return
+        self.size -= size
+
+    def _evict(self, target: int) -> None:
+        # other processes may share the directory, so go by what's actually there
+        entries = sorted(self._entries())
+        self.size = sum(size for _, _, size in entries)
+        for _, filename, size in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            self.size -= size
+            self.evictions += 1
@@ -1,21 +1,61 @@
+import mmap
+import os
+
+from typing import List
+
+from . import ondisk
 from . import vdevs
 
 
 class FileDev(vdevs.VDev):
+    # reads use os.pread/os.preadv, which don't touch the shared file position,
+    # so any number of threads can read from one FileDev without locking
     def __init__(self, path, label=None, txg=None):
-        self.f = open(path, 'r+b')
+        self.f = open(path, 'rb')
+        self.fd = self.f.fileno()
         super(FileDev, self).__init__(label, txg)
 
+    def device_size(self) -> int:
+        # st_size is 0 for block devices, but seeking to the end works for both
+        return os.lseek(self.fd, 0, os.SEEK_END)
+
     def read(self, offset, size):
-        self.seek(*offset)
-        return self.f.read(size)
+        return os.pread(self.fd, size, self.absolute_offset(offset))
+
+    def readv(self, offset, buffers: List[bytearray]) -> int:
+        return os.preadv(self.fd, buffers, self.absolute_offset(offset))
 
     def write(self, offset, data):
-        self.seek(*offset)
-        return self.f.write(data)
+        raise OSError('{} is opened read-only'.format(self.f.name))
 
     def flush(self):
         return self.f.flush()
 
     def seek(self, offset, whence):
         return self.f.seek(offset, whence)
+
+
+class MmapDev(FileDev):
+    # maps the whole image read-only; read_dva hands out memoryview slices of the
+    # mapping, so checksumming and decompression read straight from the page cache
+    def __init__(self, path, label=None, txg=None):
+        self.f = open(path, 'rb')
+        self.fd = self.f.fileno()
+        self.map = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        vdevs.VDev.__init__(self, label, txg)
+
+    def device_size(self) -> int:
+        return len(self.map)
+
+    def read(self, offset, size):
+        # labels are parsed as nvlists, which need real bytes
+        start = self.absolute_offset(offset)
+        return self.map[start:start + size]
+
+    def read_dva(self, dva: ondisk.dva) -> memoryview:
+        offset = (dva.offset * 512) + 0x400000
+        return self.view[offset:offset + dva.asize * 512]
+
+    def write(self, offset, data):
+        raise OSError('{} is mapped read-only'.format(self.f.name))
@@ -1,26 +1,198 @@
+import struct
+
 from typing import ByteString
 
+MATCH_MIN = 3
+MATCH_MAX = (1 << 6) + MATCH_MIN - 1
+OFFSET_MASK = (1 << 10) - 1
+LEMPEL_SIZE = 1024
+# the most all-literal control groups copied at once
+LITERAL_GROUPS = 512
+
+
+def _control_tokens(control: int):
+    # a positive token is a run of that many literals, 0 is a match
+    tokens = []
+    run = 0
+    for bit in range(8):
+        if control >> bit & 1:
+            if run:
+                tokens.append(run)
+                run = 0
+            tokens.append(0)
+        else:
+            run += 1
+    if run:
+        tokens.append(run)
+    return tuple(tokens)
+
+
+CONTROL_TOKENS = tuple(_control_tokens(control) for control in range(256))
+
+
+def _group_decoder(control: int):
+    # Compile group(src, pos, out, op) -> op, which decodes the tokens after
+    # control byte control without a loop or bounds checks: the literal runs
+    # are skipped over and the matches unpacked by one struct call, and the
+    # copies are unrolled. Returns it with the group's size in src.
+    tokens = CONTROL_TOKENS[control]
+    layout = struct.Struct('>' + ''.join('{}x'.format(run) if run else 'H' for run in tokens))
+    matches = ['m{}'.format(i) for i, run in enumerate(tokens) if not run]
+    lines = ['def group(src, pos, out, op):']
+    if matches:
+        lines.append('    {}, = unpack_from(src, pos)'.format(', '.join(matches)))
+    at = 0
+    for i, run in enumerate(tokens):
+        if run:
+            lines += [
+                '    out[op:op + {0}] = src[pos + {1}:pos + {2}]'.format(run, at, at + run),
+                '    op += {}'.format(run),
+            ]
+            at += run
+            continue
+        lines += [
+            '    length = (m{} >> 10) + {}'.format(i, MATCH_MIN),
+            '    start = op - (m{} & {})'.format(i, OFFSET_MASK),
+            '    if start + length <= op and start >= 0:',
+            '        out[op:op + length] = out[start:start + length]',
+            '    else:',
+            '        _repeat(out, op, start, length)',
+            '    op += length',
+        ]
+        at += 2
+    lines.append('    return op')
+    namespace = {'unpack_from': layout.unpack_from, '_repeat': _repeat}
+    exec('\n'.join(lines), namespace)
+    return namespace['group'], layout.size + 1
+
+
+def decompress(bs: ByteString, size: int) -> bytearray:
+    out = bytearray(size)
+    length = decompress_into(bs, out)
+    if length < size:
+        del out[length:]
+    return out
 
-def decompress(bs: ByteString, size: int) -> ByteString:
-    bs = bytearray(bs)
-    out = bytearray()
-    blen = len(bs)
+
+def decompress_into(bs: ByteString, out) -> int:
+    '''Decode bs into the writable buffer out, stopping when either runs out.
+    Returns the number of bytes written.'''
+    # slices of a bytearray copy into out much faster than slices of bytes
+    src = bytearray(bs)
+    size = len(out)
+    slen = len(src)
     pos = 0
-    while pos < blen and len(out) < size:
-        control = bs[pos]
+    op = 0
+    decoders = GROUP_DECODERS
+    # while a whole control group (a control byte and 8 matches) fits,
+    # groups are decoded without bounds checks
+    fast_src = slen - 17
+    fast_out = size - 8 * MATCH_MAX
+    while pos <= fast_src and op <= fast_out:
+        control = src[pos]
+        if not control:
+            # incompressible data is long stretches of all-literal groups;
+            # copy them in one go and drop the control bytes between them
+            groups = min(LITERAL_GROUPS, (slen - pos) // 9, (size - op) // 8)
+            controls = src[pos:pos + groups * 9:9]
+            groups = len(controls) - len(controls.lstrip(b'\0'))
+            literals = src[pos:pos + groups * 9]
+            del literals[::9]
+            out[op:op + groups * 8] = literals
+            op += groups * 8
+            pos += groups * 9
+        elif control == 0xff and src[pos + 1:pos + 17] == src[pos + 1:pos + 3] * 8:
+            # runs of zeros (or any repeated pattern) are groups of eight
+            # identical matches, over and over; consecutive matches with the
+            # same distance are all one copy, however many groups they span
+            group = src[pos:pos + 17]
+            length = (src[pos + 1] >> 2) + MATCH_MIN
+            distance = (src[pos + 1] & 0b11) << 8 | src[pos + 2]
+            limit = min((slen - pos) // 17, (size - op) // (8 * length))
+            groups = 1
+            while groups < limit and src[pos + groups * 17:pos + groups * 17 + 17] == group:
+                groups += 1
+            _repeat(out, op, op - distance, groups * 8 * length)
+            op += groups * 8 * length
+            pos += groups * 17
+        else:
+            group, width = decoders[control]
+            op = group(src, pos + 1, out, op)
+            pos += width
+    while pos < slen and op < size:
+        tokens = CONTROL_TOKENS[src[pos]]
         pos += 1
-        for i in range(8):
-            b = control & (1 << i) > 0
-            if not pos < blen:
+        for run in tokens:
+            if pos >= slen or op >= size:
+                break
+            if run:
+                run = min(run, slen - pos, size - op)
+                out[op:op + run] = src[pos:pos + run]
+                op += run
+                pos += run
+                continue
+            if pos + 1 >= slen:
                 break
-            if not b:
-                out.append(bs[pos])
-                pos += 1
-            else:
-                length = (bs[pos] >> 2) + 3
-                distance = (bs[pos] & 0b11) << 8 | bs[pos+1]
-                pos += 2
-                backref = out[-distance:]
-                lookup = backref * int(length / distance) + backref[:(length % distance)]
-                out += lookup
-    return out[:size]
+            b = src[pos]
+            distance = (b & 0b11) << 8 | src[pos + 1]
+            pos += 2
+            length = min((b >> 2) + MATCH_MIN, size - op)
+            _repeat(out, op, op - distance, length)
+            op += length
+    return op
+
+
+def _repeat(out, op: int, start: int, length: int) -> None:
+    if start >= op or start < 0:
+        raise ValueError('bad lzjb match at offset {}'.format(op))
+    # an overlapping match repeats the last op - start bytes; every copy
+    # doubles how much of the pattern there is to copy from
+    end = op + length
+    while op < end:
+        count = min(op - start, end - op)
+        out[op:op + count] = out[start:start + count]
+        op += count
+
+
+GROUP_DECODERS = tuple(_group_decoder(control) for control in range(256))
+
+
+def compress(bs: ByteString) -> bytes:
+    # the same algorithm as lzjb_compress in ZFS; pools never need it, but
+    # it's handy for producing test data
+    src = bytes(bs)
+    slen = len(src)
+    lempel = [0] * LEMPEL_SIZE
+    dst = bytearray()
+    copymask = 1 << 7
+    copymap = 0
+    pos = 0
+    while pos < slen:
+        copymask <<= 1
+        if copymask == 1 << 8:
+            copymap = len(dst)
+            dst.append(0)
+            copymask = 1
+        if pos > slen - MATCH_MAX:
+            dst.append(src[pos])
+            pos += 1
+            continue
+        hash_ = (src[pos] << 16) + (src[pos + 1] << 8) + src[pos + 2]
+        hash_ += hash_ >> 9
+        hash_ += hash_ >> 5
+        hash_ &= LEMPEL_SIZE - 1
+        distance = (pos - lempel[hash_]) & OFFSET_MASK
+        lempel[hash_] = pos
+        start = pos - distance
+        if start >= 0 and start != pos and src[pos:pos + MATCH_MIN] == src[start:start + MATCH_MIN]:
+            dst[copymap] |= copymask
+            length = MATCH_MIN
+            while length < MATCH_MAX and src[pos + length] == src[start + length]:
+                length += 1
+            dst.append((length - MATCH_MIN) << 2 | distance >> 8)
+            dst.append(distance & 0xff)
+            pos += length
+        else:
+            dst.append(src[pos])
+            pos += 1
+    return bytes(dst)
@@ -9,6 +9,7 @@ from typing import Union
 
 from io import BytesIO
 
+import pyndata
 import zfs.ondisk.zap
 
 from . import posix
@@ -27,11 +28,7 @@ MicroZAPType = Union[zfs.ondisk.zap.SARegistrationMicroZAP, zfs.ondisk.zap.Micro
 class ObjectSet(object):
     @classmethod
     def from_struct(cls, pool, strct: ondisk.Objectsets, dataset: 'datasets.Dataset' = None) -> 'ObjectSet':
-        blocks = []
-        for blkptr in strct.meta_dnode.blkptr:
-            block = pool.read_indirect(blkptr)
-            blocks.append(block)
-        return ObjectSet(pool, strct, b''.join(blocks), dataset=dataset)
+        return ObjectSet(pool, strct, dataset=dataset)
 
     @classmethod
     def from_block(cls, pool, block: bytes, dataset: 'datasets.Dataset' = None) -> 'ObjectSet':
@@ -39,31 +36,49 @@ class ObjectSet(object):
         objset = ObjectSet.from_struct(pool, objset_struct, dataset=dataset)
         return objset
 
-    def __init__(self, pool, raw_objectset: ondisk.Objectsets, objset: bytes, dataset=None) -> None:
+    def __init__(self, pool, raw_objectset: ondisk.Objectsets, dataset=None) -> None:
         self.raw_objectset = raw_objectset
+        self.meta_dnode = raw_objectset.meta_dnode
         self.pool = pool
         self.dataset = dataset
-        self.objset = objset
         self.dnodes = {}
         self.parsed_objset = {}
+        # dnodes are read one meta dnode block at a time, on demand
+        self.block_size = self.meta_dnode.data_sectors * 512
+        self.dnodes_per_block = max(self.block_size // 512, 1)
+
+    def __len__(self) -> int:
+        if not self.block_size:
+            return 0
+        return (self.meta_dnode.max_block_id + 1) * self.dnodes_per_block
+
+    @property
+    def objset(self) -> bytes:
+        # the entire meta dnode; only needed for dumping it
+        return self.pool.read_dnode(self.meta_dnode)
 
     def __getitem__(self, index: Union[int, slice]) -> Any:
         if isinstance(index, slice):
-            return [self[i] for i in range(index.start or 0, index.stop or len(self.objset)//512, index.step or 1)]
+            return [self[i] for i in range(index.start or 0, index.stop or len(self), index.step or 1)]
         else:
             if index not in self.parsed_objset:
                 self.parsed_objset[index] = self.parse_dnode(self.get_dnode(index), index=index)
             return self.parsed_objset[index]
 
     def __iter__(self) -> Iterator:
-        length = len(self.objset)//512
-        for i in range(length):
+        for i in range(len(self)):
             yield self.get_dnode(i)
 
     def get_dnode(self, index: int) -> ondisk.DNode:
         if index not in self.dnodes:
-            offset = index * 512
-            dn = ondisk.DNode(self.objset[offset:offset+512])
+            # only the dnode's slot is copied out; the block it's in stays in the pool's cache
+            data = self.pool.read_dnode_range(self.meta_dnode, index * 512, 512)
+            if not data:
+                # past the end of the meta dnode's data: an empty slot
+                dn = ondisk.DNode()
+            else:
+                # most dnodes only have a few fields looked at, so decode them as they're used
+                dn = ondisk.DNode.from_buffer(data, lazy=True)
             dn.index = index
             self.dnodes[index] = dn
         return self.dnodes[index]
@@ -184,12 +199,13 @@ class ObjectSet(object):
         data = ondisk.fatzap.parse_fatzap(raw_fz)
         return data
 
-    def read_bpobj(self, dnode: ondisk.DNode) -> List[ondisk.Blockptr]:
+    def read_bpobj(self, dnode: ondisk.DNode) -> pyndata.StructArray:
         hdr = ondisk.BPObjHeader(dnode.bonus)
         logger.info(hdr)
         data = self.pool.read_dnode(dnode)
-        data = BytesIO(data)
-        return [ondisk.Blockptr(data) for _ in range(hdr.length)]
+        # a bpobj can hold millions of block pointers; they're only unpacked
+        # as they're used, or a field at a time with StructArray.column()
+        return pyndata.StructArray(ondisk.Blockptr, data, 0, hdr.length)
 
     def read_object_array(self, dnode: ondisk.DNode) -> Dict:
         data = self.pool.read_dnode(dnode)
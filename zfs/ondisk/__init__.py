@@ -55,6 +55,11 @@ class Blockptr(Struct):
         raw_blkptr = self.pack()
         return EmbeddedBlockptr(raw_blkptr)
 
+    def is_hole(self) -> bool:
+        # a hole has an empty first DVA; embedded pointers keep data there instead
+        first = self.dvas[0]
+        return not self.embedded and first._first == 0 and first._offset == 0
+
 
 class EmbeddedBlockptr(Struct):
     __ENDIAN__ = 'little'
@@ -83,7 +88,10 @@ class EmbeddedBlockptr(Struct):
 
 
 class GangBlock(Struct):
+    __ENDIAN__ = 'little'
     MAGIC = 0x210da7ab10c7a11
+    SIZE = 512
+
     blocks = array(Blockptr(), length=3)
     _pad = padding(length=88)
     magic = uint64()
@@ -113,6 +121,8 @@ class Uberblock(Struct):
 
 class DNode(Struct):
     __ENDIAN__ = 'little'
+    # ObjectSet records where it found each dnode
+    __slots__ = ('index',)
 
     node_type = uint8(enum=constants.ObjectType)
     indirect_blockshift = uint8()
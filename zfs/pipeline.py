@@ -0,0 +1,73 @@
+import collections
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import Tuple
+from typing import TypeVar
+from typing import Union
+
+from . import util
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+EXECUTORS = ('thread', 'process')
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class Pipeline(object):
+    '''Reads many blocks at once.
+
+    Each block is read by a worker thread: vdev reads, hashlib, zlib and lz4
+    release the GIL, so threads overlap well for them. With executor='process'
+    the verify and decompress stage is handed on to a process pool instead,
+    which is what the pure Python checksums and codecs need to run in
+    parallel. Results always come back in order, and at most `window` blocks
+    are in flight at a time.
+    '''
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, executor: str = 'thread', window: int = None) -> None:
+        if executor not in EXECUTORS:
+            raise ValueError('unknown executor {!r}, expected one of {}'.format(executor, EXECUTORS))
+        self.workers = workers
+        self.executor = executor
+        self.window = window or 2 * workers
+        self.threads = ThreadPoolExecutor(workers)
+        self.processes = ProcessPoolExecutor(workers) if executor == 'process' else None
+
+    def map(self, function: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        pending = collections.deque()
+        try:
+            for item in items:
+                if len(pending) >= self.window:
+                    yield pending.popleft().result()
+                pending.append(self.threads.submit(function, item))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # the consumer stopped early or something failed: don't leave the rest running
+            for future in pending:
+                future.cancel()
+
+    def decode(self, data: bytes, *args, out=None) -> Tuple[Union[bytes, int], bool]:
+        # stands in for util.decode in a ReadContext
+        if self.processes is None:
+            return util.decode(data, *args, out=out)
+        # memoryviews from MmapDev can't be pickled
+        result, valid = self.processes.submit(util.decode, bytes(data), *args).result()
+        if out is None:
+            return result, valid
+        length = min(len(result), len(out))
+        out[:length] = memoryview(result)[:length]
+        return length, valid
+
+    def shutdown(self) -> None:
+        self.threads.shutdown()
+        if self.processes is not None:
+            self.processes.shutdown()
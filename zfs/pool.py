@@ -1,14 +1,21 @@
 import os.path
 
+from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Tuple
 from typing import Union
 from typing import overload
 
+from . import arc
 from . import constants
 from . import objectset
+from . import pipeline
 from . import readcontext
 from . import datasets
+from . import diskcache
 from . import vdevs
+from . import verified
 from . import posix
 
 
@@ -19,29 +26,89 @@ def vdev_list_to_dict(vdevs):
     return d
 
 
+DEFAULT_CACHE_SIZE = 64 << 20
+DEFAULT_INDIRECT_CACHE_SIZE = 16 << 20
+DEFAULT_GANG_CACHE_SIZE = 1 << 20
+DEFAULT_VERIFY_SAMPLE_RATE = 1 / 16
+
+
 class Pool(object):
-    def __init__(self, vdevs: List[vdevs.VDev], try_config=None) -> None:
+    def __init__(self, vdevs: List[vdevs.VDev], try_config=None, cache_size: int = DEFAULT_CACHE_SIZE,
+                 compressed_cache_size: int = 0, cache_dir: str = None,
+                 cache_dir_size: int = diskcache.DEFAULT_MAX_BYTES,
+                 verify: constants.Verify = constants.Verify.ALWAYS,
+                 verify_sample_rate: float = DEFAULT_VERIFY_SAMPLE_RATE,
+                 workers: int = 0, executor: str = 'thread') -> None:
         self.vdevs = vdev_list_to_dict(vdevs)
         self.default_compression = constants.Compression.LZJB
         self.default_checksum = constants.Checksum.FLETCHER_4
         self.ashift = self.first_vdev().best_label[b'vdev_tree'][b'ashift']
         self.version = self.first_vdev().best_label[b'version']
         self.try_config = try_config or set()
-
+        # decompressed blocks keyed by (vdev, offset, birth txg), stored with whether they were verified
+        self.cache = arc.ARC(cache_size)
+        # indirect blocks, with their block pointers parsed as they're used
+        self.indirect_cache = arc.ARC(DEFAULT_INDIRECT_CACHE_SIZE)
+        # verified gang headers, keyed like blocks
+        self.gang_cache = arc.ARC(DEFAULT_GANG_CACHE_SIZE)
+        # optional tier holding blocks in their on-disk compressed form
+        self.compressed_cache = arc.ARC(compressed_cache_size) if compressed_cache_size else None
+        # optional on-disk cache that survives between runs
+        self.disk_cache = diskcache.DiskCache(cache_dir, max_bytes=cache_dir_size) if cache_dir else None
+        # how much checksumming to do; see constants.Verify
+        self.verify = verify
+        self.verify_sample_rate = verify_sample_rate
+        self.verified = verified.VerifiedSet()
+        # with workers, the whole blocks of a range are read concurrently; see pipeline.Pipeline
+        self.pipeline = pipeline.Pipeline(workers, executor) if workers else None
+
+        # keyed by (vdev id, active uberblock txg)
         self._meta_object_sets = {}
+        self._root_datasets = {}
+
+    def close(self) -> None:
+        '''Stop the pool's workers, if it has any.'''
+        if self.pipeline is not None:
+            self.pipeline.shutdown()
+            self.pipeline = None
+
+    def __enter__(self) -> 'Pool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
     def first_vdev(self) -> vdevs.VDev:
         return list(self.vdevs.values())[0]
 
-    def context(self) -> readcontext.ReadContext:
+    def context(self, verify: constants.Verify = None) -> readcontext.ReadContext:
+        # pass verify=Verify.ALWAYS to check every block whatever the pool's policy
         return readcontext.ReadContext(
             self.vdevs,
             self.default_compression,
             self.default_checksum,
             self.ashift,
-            self.try_config
+            self.try_config,
+            cache=self.cache,
+            compressed_cache=self.compressed_cache,
+            disk_cache=self.disk_cache,
+            verify=verify or self.verify,
+            verified_set=self.verified,
+            verify_sample_rate=self.verify_sample_rate,
+            block_pipeline=self.pipeline,
+            indirect_cache=self.indirect_cache,
+            gang_cache=self.gang_cache,
         )
 
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {'decompressed': self.cache.stats(), 'indirect': self.indirect_cache.stats(),
+                 'gang': self.gang_cache.stats()}
+        if self.compressed_cache is not None:
+            stats['compressed'] = self.compressed_cache.stats()
+        if self.disk_cache is not None:
+            stats['disk'] = self.disk_cache.stats()
+        return stats
+
     def read_block(self, blkptr) -> bytes:
         return self.context().read_block(blkptr)
 
@@ -51,6 +118,15 @@ class Pool(object):
     def read_dnode(self, dnode) -> bytes:
         return self.context().read_dnode(dnode)
 
+    def read_dnode_range(self, dnode, offset: int, length: int) -> bytes:
+        return self.context().read_dnode_range(dnode, offset, length)
+
+    def read_dnode_range_into(self, dnode, offset: int, out: memoryview) -> int:
+        return self.context().read_dnode_range_into(dnode, offset, out)
+
+    def dnode_extents(self, dnode) -> Iterator[Tuple[int, int, bool]]:
+        return self.context().dnode_extents(dnode)
+
     def read_file(self, path: str) -> bytes:
         pathes = os.path.split(path)
         if len(pathes) != 2:
@@ -72,18 +148,21 @@ class Pool(object):
     def objset_for_vdev(self, vdev) -> objectset.ObjectSet:
         if isinstance(vdev, int):
             vdev = self.vdevs[vdev]
-        root = self.read_indirect(vdev.active_uberblock.root)
-        vdev_id = vdev.id
-        if vdev_id not in self._meta_object_sets:
-            self._meta_object_sets[vdev_id] = objectset.ObjectSet.from_block(self, root)
-        return self._meta_object_sets[vdev_id]
+        key = (vdev.id, vdev.active_uberblock.txg)
+        if key not in self._meta_object_sets:
+            root = self.read_indirect(vdev.active_uberblock.root)
+            self._meta_object_sets[key] = objectset.ObjectSet.from_block(self, root)
+        return self._meta_object_sets[key]
 
     @property
     def root_dataset(self) -> datasets.Dataset:
-        objset = self.objset_for_vdev(self.first_vdev())
-        dir_index = objset[1]['root_dataset']
-        dataset = objset[dir_index]
-        return dataset
+        vdev = self.first_vdev()
+        key = (vdev.id, vdev.active_uberblock.txg)
+        if key not in self._root_datasets:
+            objset = self.objset_for_vdev(vdev)
+            dir_index = objset[1]['root_dataset']
+            self._root_datasets[key] = objset[dir_index]
+        return self._root_datasets[key]
 
     def metaslab_array(self):
         location = self.first_vdev().best_label[b'metaslab_array']
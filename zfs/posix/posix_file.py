@@ -1,4 +1,10 @@
+import errno
+import io
 import logging
+import os
+
+from typing import List
+from typing import Tuple
 
 from . import PosixObject
 
@@ -8,5 +14,108 @@ logger = logging.getLogger(__name__)
 class File(PosixObject):
 
     def read(self) -> bytes:
+        # a sparse file can end in a hole past the object's last block
+        size = self.attrs['ZPL_SIZE']
         data = self.dataset.pool.read_dnode(self.dnode)
-        return data[:self.attrs['ZPL_SIZE']]
+        return data[:size].ljust(size, b'\0')
+
+    def read_range(self, offset: int, length: int) -> bytes:
+        length = min(length, self.attrs['ZPL_SIZE'] - offset)
+        if length <= 0:
+            return b''
+        return self.dataset.pool.read_dnode_range(self.dnode, offset, length).ljust(length, b'\0')
+
+    def read_range_into(self, offset: int, buffer) -> int:
+        out = memoryview(buffer).cast('B')
+        length = min(len(out), self.attrs['ZPL_SIZE'] - offset)
+        if length <= 0:
+            return 0
+        written = self.dataset.pool.read_dnode_range_into(self.dnode, offset, out[:length])
+        out[written:length] = bytes(length - written)
+        return length
+
+    def data_extents(self) -> List[Tuple[int, int, bool]]:
+        '''The file's data and holes, as (offset, length, is_data) runs covering
+        it from start to end. Holes read as zeros, and cost no I/O to read.'''
+        size = self.attrs['ZPL_SIZE']
+        extents = []  # type: List[Tuple[int, int, bool]]
+        runs = list(self.dataset.pool.dnode_extents(self.dnode))
+        end = runs[-1][0] + runs[-1][1] if runs else 0
+        if end < size:
+            # past the object's last block, the file is a hole
+            runs.append((end, size - end, False))
+        for offset, length, is_data in runs:
+            if offset >= size:
+                break
+            length = min(length, size - offset)
+            if extents and extents[-1][2] == is_data:
+                extents[-1] = (extents[-1][0], extents[-1][1] + length, is_data)
+            else:
+                extents.append((offset, length, is_data))
+        return extents
+
+    def seek_data(self, offset: int) -> int:
+        '''The first offset at or after offset that holds data, like lseek's SEEK_DATA.'''
+        for start, length, is_data in self.data_extents():
+            if is_data and offset < start + length:
+                return max(start, offset)
+        raise OSError(errno.ENXIO, 'no data after offset {}'.format(offset))
+
+    def seek_hole(self, offset: int) -> int:
+        '''The first offset at or after offset in a hole, like lseek's SEEK_HOLE.
+        The end of the file counts as a hole.'''
+        size = self.attrs['ZPL_SIZE']
+        if offset > size:
+            raise OSError(errno.ENXIO, 'offset {} is past the end of the file'.format(offset))
+        for start, length, is_data in self.data_extents():
+            if not is_data and offset < start + length:
+                return max(start, offset)
+        return size
+
+    def open(self) -> io.BufferedReader:
+        block_size = self.dnode.data_sectors * 512 or io.DEFAULT_BUFFER_SIZE
+        return io.BufferedReader(FileReader(self), buffer_size=block_size)
+
+
+class FileReader(io.RawIOBase):
+    '''A seekable, read-only stream over a File's blocks.
+    Only the blocks covering each read are held in memory.
+    '''
+
+    def __init__(self, file: File) -> None:
+        self.file = file
+        self.size = file.attrs['ZPL_SIZE']
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        # whole blocks are decompressed straight into buffer
+        length = self.file.read_range_into(self.position, buffer)
+        self.position += length
+        return length
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        elif whence == getattr(os, 'SEEK_DATA', None):
+            position = self.file.seek_data(offset)
+        elif whence == getattr(os, 'SEEK_HOLE', None):
+            position = self.file.seek_hole(offset)
+        else:
+            raise ValueError('invalid whence ({})'.format(whence))
+        if position < 0:
+            raise OSError('negative seek position {}'.format(position))
+        self.position = position
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
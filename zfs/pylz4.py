@@ -0,0 +1,64 @@
+'''A pure Python LZ4 block decoder, used when the `lz4` package isn't installed.'''
+
+from typing import ByteString
+
+
+def decompress(bs: ByteString, size: int) -> bytes:
+    # bs is a bare LZ4 block, without ZFS's length prefix
+    out = bytearray(size)
+    length = decompress_into(bs, out)
+    if length != size:
+        del out[length:]
+    return bytes(out)
+
+
+def decompress_into(bs: ByteString, out) -> int:
+    '''Decode bs into the writable buffer out. Returns the number of bytes written.'''
+    src = memoryview(bs).cast('B')
+    size = len(out)
+    slen = len(src)
+    pos = 0
+    op = 0
+    while pos < slen:
+        token = src[pos]
+        pos += 1
+        length = token >> 4
+        if length == 15:
+            while True:
+                b = src[pos]
+                pos += 1
+                length += b
+                if b != 255:
+                    break
+        if length:
+            if op + length > size or pos + length > slen:
+                raise ValueError('lz4 literal run overflows the block')
+            out[op:op + length] = src[pos:pos + length]
+            op += length
+            pos += length
+        if pos >= slen:
+            # the last sequence is literals only
+            break
+        distance = src[pos] | (src[pos + 1] << 8)
+        pos += 2
+        length = token & 15
+        if length == 15:
+            while True:
+                b = src[pos]
+                pos += 1
+                length += b
+                if b != 255:
+                    break
+        length += 4
+        start = op - distance
+        if distance == 0 or start < 0 or op + length > size:
+            raise ValueError('bad lz4 match at offset {}'.format(op))
+        if distance >= length:
+            out[op:op + length] = out[start:start + length]
+        else:
+            # an overlapping match repeats the last `distance` bytes
+            pattern = bytes(out[start:op])
+            repeats, rest = divmod(length, distance)
+            out[op:op + length] = pattern * repeats + pattern[:rest]
+        op += length
+    return op
@@ -1,23 +1,67 @@
 import codecs
 import logging
+import random
 
+from typing import Iterator
+from typing import List
+from typing import Optional
 from typing import Tuple
+from typing import Union
 
+from . import arc
+from . import diskcache
 from . import ondisk
+from . import pipeline
 from . import util
+from . import verified
 
-from .constants import Compression, Checksum, TryConfig
+from .constants import Compression, Checksum, TryConfig, Verify
 
 logger = logging.getLogger(__name__)
 
 
+class Indirect(object):
+    '''The block pointers in an indirect block, each parsed the first time it's used.
+    Only the fields that are actually read get decoded.'''
+    __slots__ = ('data', 'blkptrs')
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.blkptrs = [None] * (len(data) // 128)  # type: List[Optional[ondisk.Blockptr]]
+
+    def __len__(self) -> int:
+        return len(self.blkptrs)
+
+    def __getitem__(self, slot: int) -> ondisk.Blockptr:
+        blkptr = self.blkptrs[slot]
+        if blkptr is None:
+            blkptr = self.blkptrs[slot] = ondisk.Blockptr.from_buffer(self.data, slot * 128, lazy=True)
+        return blkptr
+
+
 class ReadContext(object):
-    def __init__(self, vdevs, compression, checksum, ashift, try_config):
+    def __init__(self, vdevs, compression, checksum, ashift, try_config, cache: arc.ARC = None,
+                 compressed_cache: arc.ARC = None, disk_cache: diskcache.DiskCache = None,
+                 verify: Verify = Verify.ALWAYS, verified_set: verified.VerifiedSet = None,
+                 verify_sample_rate: float = 0.0, block_pipeline: pipeline.Pipeline = None,
+                 indirect_cache: arc.ARC = None, gang_cache: arc.ARC = None):
         self.vdevs = vdevs
         self.default_compression = compression
         self.default_checksum = checksum
+        self.ashift = ashift
         self.blocksize = 1 << ashift
         self.try_config = try_config
+        self.cache = cache
+        self.compressed_cache = compressed_cache
+        self.disk_cache = disk_cache
+        self.verify = verify
+        self.verified = verified_set if verified_set is not None else verified.VerifiedSet()
+        self.verify_sample_rate = verify_sample_rate
+        self.pipeline = block_pipeline
+        self.indirect_cache = indirect_cache
+        self.gang_cache = gang_cache
+        # the verify and decompress stage of a read, which the pipeline may run elsewhere
+        self.decode = block_pipeline.decode if block_pipeline is not None else util.decode
 
     def checksum(self, data: bytes, valid, checksum) -> bool:
         return util.checksum(data, valid, checksum, self.default_checksum)
@@ -32,7 +76,9 @@ class ReadContext(object):
             self.default_checksum = checksum
 
     def read_block(self, blkptr: ondisk.Blockptr, dva_offset=0) -> bytes:
-        if TryConfig.read_all_dvas in self.try_config:
+        if blkptr.is_hole():
+            return self._read_hole(blkptr)
+        elif TryConfig.read_all_dvas in self.try_config:
             block = self.read_block_thorough(blkptr)
             return block
         elif blkptr.embedded:
@@ -47,10 +93,10 @@ class ReadContext(object):
     def read_block_thorough(self, blkptr: ondisk.Blockptr) -> bytes:
         # this function tries DVAs in the blkptr until one works
         # DVAs with asize 0 are bullshit
-        # we can pretend a blkptr whose DVAs are all size 0 is an empty string
-        # but that's probably wrong
         if blkptr.embedded:
             return self._read_block_embedded(blkptr)
+        if blkptr.is_hole():
+            return self._read_hole(blkptr)
         if all(dva.asize == 0 for dva in blkptr.dvas):
             logger.debug('read an empty block pointer: {}'.format(blkptr))
             return b''
@@ -84,38 +130,336 @@ class ReadContext(object):
             logger.error('failed to read any DVAs in block pointer {}'.format(blkptr))
             return b''
 
+    @staticmethod
+    def _read_hole(blkptr: ondisk.Blockptr) -> bytes:
+        # holes were never written, so there's nothing to read: they're zeros
+        return bytes((blkptr.logical_size + 1) * 512)
+
     def _read_block_embedded(self, blkptr: ondisk.Blockptr) -> bytes:
         embedded_blkptr = blkptr.to_embedded()
         raw_data = embedded_blkptr.data
         data = self.decompress(raw_data, embedded_blkptr.compression, embedded_blkptr.logical_size+1)
         return data
 
+    def should_verify(self, key: Tuple[int, int, int], blkptr: ondisk.Blockptr) -> bool:
+        if self.verify == Verify.ALWAYS:
+            return True
+        elif self.verify == Verify.ONCE:
+            return key not in self.verified
+        elif self.verify == Verify.METADATA:
+            return blkptr.level > 0 or blkptr.object_type not in diskcache.DATA_TYPES
+        elif self.verify == Verify.SAMPLED:
+            return random.random() < self.verify_sample_rate
+        else:
+            return False
+
+    def _cached(self, cache: arc.ARC, key: Tuple[int, int, int]) -> Optional[Tuple[bytes, bool]]:
+        # cache entries are (data, verified); blocks cached under a laxer
+        # policy don't count as hits when every block has to be verified,
+        # and are dropped so the verified copy can replace them
+        if cache is None:
+            return None
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if not entry[1] and self.verify == Verify.ALWAYS:
+            cache.discard(key)
+            return None
+        return entry
+
+    def _verify(self, key: Tuple[int, int, int], blkptr: ondisk.Blockptr, data: bytes) -> bool:
+        valid = self.checksum(data, blkptr.checksum, blkptr.checksum_type)
+        if valid:
+            self.verified.add(key)
+        return valid
+
     def _read_block(self, blkptr: ondisk.Blockptr, dva: ondisk.dva) -> Tuple[bytes, bool]:
-        vdev = self.vdevs[dva.vdev]
-        data = vdev.read_dva(dva)
-        physical_size = (blkptr.physical_size + 1) * 512
-        data = data[:physical_size]
-        valid_chk = self.checksum(data, blkptr.checksum, blkptr.checksum_type)
-        logical_size = (blkptr.logical_size + 1) * 512
-        if valid_chk:
-            logger.debug('decompress: {} {} {}'.format(blkptr, physical_size, logical_size))
-            data = self.decompress(data, blkptr.compression, logical_size)
+        key = (dva.vdev, dva.offset, blkptr.birth)
+        entry = self._cached(self.cache, key)
+        if entry is not None:
+            return entry[0], True
+        data, verified = self._fetch(key, blkptr, dva)
+        data, valid_chk, was_verified = self._decode(key, blkptr, data, verified)
+        if valid_chk and self.cache is not None:
+            self.cache.put(key, (data, was_verified), len(data))
         return data, valid_chk
 
-    def read_indirect(self, blkptr: ondisk.Blockptr) -> bytes:
-        resolved = []
-        if blkptr.level > 0:
-            data = self.read_block(blkptr)
-            indirect = ondisk.indirect(size=blkptr.logical_size + 1)
-            ind = indirect(data)
-            for ptr in ind.blocks:
-                resolved.append(self.read_indirect(ptr))
+    def _fetch(self, key: Tuple[int, int, int], blkptr: ondisk.Blockptr,
+               dva: ondisk.dva) -> Tuple[bytes, Optional[bool]]:
+        # the first stage of a read: the block as stored on disk, and whether
+        # it has been verified, or None if it's fresh from a vdev
+        entry = self._cached(self.compressed_cache, key)
+        if entry is not None:
+            return entry
+        if self.disk_cache is not None:
+            # the disk cache may be stale or damaged, so its hits are verified under every policy
+            data = self.disk_cache.get(key, blkptr, lambda d: self._verify(key, blkptr, d))
+            if data is not None:
+                if self.compressed_cache is not None and blkptr.compression != Compression.OFF:
+                    self.compressed_cache.put(key, (data, True), len(data))
+                return data, True
+        return self._read_physical(blkptr, dva), None
+
+    def _read_physical(self, blkptr: ondisk.Blockptr, dva: ondisk.dva) -> bytes:
+        # the block's physical (still compressed) data, gathered from the pieces of a gang block if need be
+        if dva.gang:
+            data = b''.join(self._read_gang_member(child) for child in self.read_gang_header(blkptr, dva).blocks
+                            if not child.is_hole())
+        else:
+            data = self.vdevs[dva.vdev].read_dva(dva)
+        return data[:(blkptr.physical_size + 1) * 512]
+
+    def _read_gang_member(self, blkptr: ondisk.Blockptr) -> bytes:
+        # members of a gang are never compressed, but they're checksummed like any other block
+        data = self._read_physical(blkptr, blkptr.dvas[0])
+        if not self.checksum(data, blkptr.checksum, blkptr.checksum_type):
+            logger.error('bad checksum in gang member {}'.format(blkptr))
+        return data
+
+    def read_gang_header(self, blkptr: ondisk.Blockptr, dva: ondisk.dva) -> ondisk.GangBlock:
+        '''The gang header at dva, which lists the blocks holding blkptr's data.
+        Headers are always verified, and are cached once they have been.'''
+        key = (dva.vdev, dva.offset, blkptr.birth)
+        if self.gang_cache is not None:
+            header = self.gang_cache.get(key)
+            if header is not None:
+                return header
+        # a gang DVA's asize covers the header and all its members; the header is one sector
+        header_dva = ondisk.dva(dva.pack())
+        header_dva.asize = max(ondisk.GangBlock.SIZE, self.blocksize) >> 9
+        data = self.vdevs[dva.vdev].read_dva(header_dva)[:ondisk.GangBlock.SIZE]
+        header = ondisk.GangBlock(data)
+        if header.magic != ondisk.GangBlock.MAGIC:
+            raise ValueError('bad gang header magic {:#x} at {}'.format(header.magic, dva))
+        # every copy of the header is checksummed against the first DVA, not the one it was read from
+        identity = blkptr.dvas[0]
+        verifier = (identity.vdev, identity.offset << 9, blkptr.phys_birth or blkptr.birth, 0)
+        if not util.checksum_embedded(data, verifier):
+            raise ValueError('bad gang header checksum at {}'.format(dva))
+        if self.gang_cache is not None:
+            self.gang_cache.put(key, header, ondisk.GangBlock.SIZE)
+        return header
+
+    def _decode(self, key: Tuple[int, int, int], blkptr: ondisk.Blockptr, data: bytes,
+                verified: Optional[bool], out: memoryview = None) -> Tuple[Union[bytes, int], bool, bool]:
+        # the second stage: verify the block if it's fresh and the policy asks
+        # for it, then decompress it. Returns the data (or the length written
+        # into out), whether it's valid, and whether it was verified.
+        fresh = verified is None
+        check = fresh and self.should_verify(key, blkptr)
+        logical_size = (blkptr.logical_size + 1) * 512
+        result, valid = self.decode(data, blkptr.checksum, blkptr.checksum_type, check, blkptr.compression,
+                                    logical_size, self.default_checksum, self.default_compression, out=out)
+        if check and valid:
+            self.verified.add(key)
+        if fresh and valid:
+            if self.disk_cache is not None:
+                self.disk_cache.put(key, blkptr, data)
+            if self.compressed_cache is not None and blkptr.compression != Compression.OFF:
+                self.compressed_cache.put(key, (data, check), len(data))
+        return result, valid, check or bool(verified)
+
+    def read_block_into(self, blkptr: ondisk.Blockptr, out: memoryview) -> int:
+        '''Read a block into out, decompressing it in place when possible.
+        Returns the number of bytes written.
+
+        Blocks already in the decompressed cache are copied from it, and
+        blocks decoded here are added to it, like blocks from read_block.
+        Uncompressed blocks are read from the vdev straight into out.
+        '''
+        if blkptr.is_hole():
+            length = min((blkptr.logical_size + 1) * 512, len(out))
+            out[:length] = bytes(length)
+            return length
+        if TryConfig.read_all_dvas in self.try_config or blkptr.embedded:
+            return self._copy_into(self.read_block(blkptr), out)
+        dva = blkptr.dvas[0]
+        key = (dva.vdev, dva.offset, blkptr.birth)
+        entry = self._cached(self.cache, key)
+        if entry is not None:
+            return self._copy_into(entry[0], out)
+        if self._reads_into(blkptr, dva, out):
+            length, valid_chk, was_verified = self._read_physical_into(key, blkptr, dva, out)
         else:
+            data, verified = self._fetch(key, blkptr, dva)
+            length, valid_chk, was_verified = self._decode(key, blkptr, data, verified, out)
+        if not valid_chk:
+            logger.error('bad checksum in block {}'.format(blkptr))
+        elif self.cache is not None:
+            self.cache.put(key, (bytes(out[:length]), was_verified), length)
+        return length
+
+    def _reads_into(self, blkptr: ondisk.Blockptr, dva: ondisk.dva, out: memoryview) -> bool:
+        # blocks stored as they are, in one piece, can be read straight into
+        # out; the disk cache is checked before any vdev, so it has to be off
+        return (blkptr.compression == Compression.OFF and not dva.gang and self.disk_cache is None
+                and len(out) >= (blkptr.physical_size + 1) * 512)
+
+    def _read_physical_into(self, key: Tuple[int, int, int], blkptr: ondisk.Blockptr, dva: ondisk.dva,
+                            out: memoryview) -> Tuple[int, bool, bool]:
+        # the scatter read version of _fetch and _decode, for _reads_into blocks
+        view = out[:(blkptr.physical_size + 1) * 512]
+        length = self.vdevs[dva.vdev].read_dva_into(dva, [view])
+        check = self.should_verify(key, blkptr)
+        valid = not check or self.checksum(view[:length], blkptr.checksum, blkptr.checksum_type)
+        if check and valid:
+            self.verified.add(key)
+        return length, valid, check
+
+    @staticmethod
+    def _copy_into(data: bytes, out: memoryview) -> int:
+        length = min(len(data), len(out))
+        out[:length] = memoryview(data)[:length]
+        return length
+
+    def read_indirect(self, blkptr: ondisk.Blockptr) -> bytes:
+        if blkptr.level == 0:
             return self.read_block(blkptr)
-        return b''.join(resolved)
+        per_indirect = (blkptr.logical_size + 1) * 512 // 128
+        blocks = list(self._walk([blkptr], blkptr.level, per_indirect, 0, per_indirect ** blkptr.level - 1))
+        # every L0 block of an object has the same size
+        block_size = next(((bp.logical_size + 1) * 512 for _, _, bp in blocks if not bp.is_hole()), 0)
+        out = memoryview(bytearray(sum(count for _, count, _ in blocks) * block_size))
+        position = 0
+        for _, count, bp in blocks:
+            view = out[position:position + count * block_size]
+            if bp.is_hole():
+                view[:] = bytes(len(view))
+            else:
+                self._fill(view, self.read_block_into(bp, view))
+            position += len(view)
+        return out.obj
 
     def read_dnode(self, dnode: ondisk.DNode) -> bytes:
-        return b''.join(self.read_indirect(bp) for bp in dnode.blkptr)
+        return self.read_dnode_range(dnode, 0, (dnode.max_block_id + 1) * dnode.data_sectors * 512)
+
+    def read_dnode_range(self, dnode: ondisk.DNode, offset: int, length: int) -> bytes:
+        # only the indirect blocks and L0 blocks covering the range are read
+        block_size = dnode.data_sectors * 512
+        length = min(length, (dnode.max_block_id + 1) * block_size - offset)
+        if length <= 0:
+            return b''
+        out = bytearray(length)
+        self.read_dnode_range_into(dnode, offset, memoryview(out))
+        return bytes(out)
+
+    def read_dnode_range_into(self, dnode: ondisk.DNode, offset: int, out: memoryview) -> int:
+        '''Fill out with the object's data starting at offset, stopping at the
+        end of its last block. Returns the number of bytes written.
+
+        L0 blocks that fall entirely inside out are decompressed straight into
+        their place in it; only partially covered blocks are copied.
+        '''
+        block_size = dnode.data_sectors * 512
+        if block_size == 0:
+            return 0
+        length = min(len(out), (dnode.max_block_id + 1) * block_size - offset)
+        if length <= 0:
+            return 0
+        first = offset // block_size
+        last = (offset + length - 1) // block_size
+        whole_blocks = []
+        for block_id, count, blkptr in self.walk_dnode(dnode, first, last):
+            start = block_id * block_size - offset
+            end = start + count * block_size
+            low = max(start, 0)
+            high = min(end, length)
+            if blkptr.is_hole():
+                out[low:high] = bytes(high - low)
+            elif low == start and high == end:
+                whole_blocks.append((blkptr, out[low:high]))
+            else:
+                data = self.read_block(blkptr)
+                self._fill(out[low:high], self._copy_into(memoryview(data)[low - start:], out[low:high]))
+        if self.pipeline is not None and len(whole_blocks) > 1:
+            written = self.pipeline.map(lambda block: self.read_block_into(*block), whole_blocks)
+        else:
+            written = (self.read_block_into(blkptr, view) for blkptr, view in whole_blocks)
+        for (_, view), length_written in zip(whole_blocks, written):
+            self._fill(view, length_written)
+        return length
+
+    @staticmethod
+    def _fill(view: memoryview, written: int) -> None:
+        # short or unreadable blocks read as zeros, so later blocks stay where they belong
+        if written < len(view):
+            view[written:] = bytes(len(view) - written)
+
+    def dnode_extents(self, dnode: ondisk.DNode) -> Iterator[Tuple[int, int, bool]]:
+        '''Yield (offset, length, is_data) for the alternating runs of data
+        and holes in an object, from the block pointers alone. Only indirect
+        blocks are read. Every run ends on a block boundary.'''
+        block_size = dnode.data_sectors * 512
+        if block_size == 0:
+            return
+        run_start = 0
+        run_data = None
+        position = 0
+        for block_id, count, blkptr in self.walk_dnode(dnode):
+            is_data = not blkptr.is_hole()
+            if is_data != run_data:
+                if position > run_start:
+                    yield run_start, position - run_start, run_data
+                run_start = position
+                run_data = is_data
+            position = (block_id + count) * block_size
+        if position > run_start:
+            yield run_start, position - run_start, run_data
+
+    def walk_dnode(self, dnode: ondisk.DNode, first: int = 0,
+                   last: int = None) -> Iterator[Tuple[int, int, ondisk.Blockptr]]:
+        '''Yield (block id, block count, blkptr) for the object's L0 blocks
+        first..last, in order. A hole above L0 is yielded once, covering all of
+        its blocks in the range; everything else has a count of 1.'''
+        if last is None:
+            last = dnode.max_block_id
+        per_indirect = 1 << (dnode.indirect_blockshift - 7)
+        return self._walk(dnode.blkptr, max(dnode.indirect_levels, 1) - 1, per_indirect, first, last)
+
+    def _walk(self, blkptrs, level: int, per_indirect: int, first: int, last: int):
+        span = per_indirect ** level
+        # (blkptr, level, first block id under it), the next one to visit on top
+        stack = [(bp, level, i * span) for i, bp in enumerate(blkptrs)]
+        stack.reverse()
+        while stack:
+            blkptr, level, start = stack.pop()
+            span = per_indirect ** level
+            if start > last or start + span <= first:
+                continue
+            low = max(first, start)
+            high = min(last, start + span - 1)
+            if blkptr.is_hole():
+                yield low, high - low + 1, blkptr
+            elif level == 0:
+                yield start, 1, blkptr
+            else:
+                children = self.read_indirect_block(blkptr)
+                child_span = span // per_indirect
+                for slot in range((high - start) // child_span, (low - start) // child_span - 1, -1):
+                    stack.append((children[slot], level - 1, start + slot * child_span))
+
+    def read_indirect_block(self, blkptr: ondisk.Blockptr) -> Indirect:
+        # parsed indirect blocks are shared between contexts, like decompressed ones
+        dva = blkptr.dvas[0]
+        key = (dva.vdev, dva.offset, blkptr.birth)
+        if TryConfig.read_all_dvas in self.try_config or blkptr.embedded:
+            return Indirect(self.read_block(blkptr))
+        entry = self._cached(self.indirect_cache, key)
+        if entry is not None:
+            return entry[0]
+        # not through _read_block: the parsed block is all that's cached, not its bytes as well
+        data, verified = self._fetch(key, blkptr, dva)
+        data, valid, was_verified = self._decode(key, blkptr, data, verified)
+        if not valid:
+            logger.error('bad checksum in block {}'.format(blkptr))
+        block = Indirect(data)
+        if valid and self.indirect_cache is not None:
+            self.indirect_cache.put(key, (block, was_verified), len(data))
+        return block
 
     def context(self):
-        return ReadContext(self.vdevs, self.default_compression, self.checksum, self.blocksize, self.try_config)
+        return ReadContext(self.vdevs, self.default_compression, self.default_checksum, self.ashift, self.try_config,
+                           cache=self.cache, compressed_cache=self.compressed_cache, disk_cache=self.disk_cache,
+                           verify=self.verify, verified_set=self.verified, verify_sample_rate=self.verify_sample_rate,
+                           block_pipeline=self.pipeline, indirect_cache=self.indirect_cache,
+                           gang_cache=self.gang_cache)
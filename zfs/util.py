@@ -1,10 +1,13 @@
+import functools
 import hashlib
 import logging
 import struct
-import zlib
 
+from typing import List
 from typing import Tuple
+from typing import Union
 
+from . import compression
 
 from .constants import Checksum
 from .constants import Compression
@@ -12,16 +15,9 @@ from .constants import Compression
 logger = logging.getLogger(__name__)
 
 try:
-    from . import rlzjb as lzjb
+    import numpy
 except ImportError:
-    from . import lzjb
-
-try:
-    import lz4
-    import lz4.block
-except ImportError:
-    lz4 = None
-    logger.warn("import lz4 failed, lz4 decompression will not be available.")
+    numpy = None
 
 
 counter = __import__('itertools').count()
@@ -30,26 +26,46 @@ counter = __import__('itertools').count()
 def decompress(data: bytes, mode: Compression, size: int, inherit=None) -> bytes:
     if mode == Compression.INHERIT:
         mode = inherit
-    if mode in (Compression.ON, Compression.LZJB):
-        return bytes(lzjb.decompress(data, size))
-    elif mode == Compression.LZ4 and lz4:
-        length = struct.unpack('>I', data[:4])[0]
-        data = data[4:length + 4]
-        return lz4.block.decompress(struct.pack('<i', size) + data)
-    elif mode.name.startswith('GZIP_'):
-        data = zlib.decompress(data)
-        return data[:size]
-    elif mode == Compression.OFF:
-        return data
-    else:
-        if mode == Compression.LZ4 and not lz4:
-            logging.error("Got a block with lz4 compression, but don't have `lz4` available")
-        raise ValueError(mode)
+    if mode == Compression.OFF:
+        # vdevs may hand out memoryviews; callers always get bytes
+        return bytes(data)
+    return compression.decompress(data, mode, size)
+
+
+def decompress_into(data: bytes, mode: Compression, out, inherit=None) -> int:
+    # like decompress, but writes into the writable buffer out and returns the length written
+    if mode == Compression.INHERIT:
+        mode = inherit
+    if mode == Compression.OFF:
+        length = min(len(data), len(out))
+        out[:length] = memoryview(data)[:length]
+        return length
+    return compression.decompress_into(data, mode, out)
 
 
 ChecksumType = Tuple[int, int, int, int]
 
 
+def decode(data: bytes, valid: ChecksumType, checksum_type: Checksum, check: bool, compression: Compression,
+           size: int, inherit_checksum: Checksum = None, inherit_compression: Compression = None,
+           out=None) -> Tuple[Union[bytes, int], bool]:
+    '''Verify (if check is set) and decompress one block read from disk.
+
+    Returns the data and whether it's valid, or with out, the number of bytes
+    written into it. Blocks that fail their checksum come back as they were
+    read. This only takes plain values so it can run in another process.
+    '''
+    if check and not checksum(data, valid, checksum_type, inherit_checksum):
+        if out is None:
+            return bytes(data), False
+        length = min(len(data), len(out))
+        out[:length] = memoryview(data)[:length]
+        return length, False
+    if out is None:
+        return decompress(data, compression, size, inherit_compression), True
+    return decompress_into(data, compression, out[:size], inherit_compression), True
+
+
 def checksum(data: bytes,
             valid: ChecksumType,
             mode: Checksum,
@@ -72,6 +88,14 @@ def checksum(data: bytes,
     return all(c == v for c, v in zip(chk, valid))
 
 
+def checksum_embedded(data: bytes, verifier: ChecksumType) -> bool:
+    # blocks like gang headers carry their own SHA256 in their last 32 bytes,
+    # computed with a verifier (derived from where the block lives) in its place
+    data = bytes(data)
+    stored = struct.unpack('<QQQQ', data[-32:])
+    return sha256(data[:-32] + struct.pack('<QQQQ', *verifier)) == stored
+
+
 def sha256(data: bytes) -> ChecksumType:
     return struct.unpack('>QQQQ', hashlib.sha256(data).digest())
 
@@ -81,7 +105,7 @@ def unpack(data: bytes, code: str):
     return struct.unpack(code*int(len(data)/s), data)
 
 
-def fletcher2(data: bytes) -> ChecksumType:
+def fletcher2_python(data: bytes) -> ChecksumType:
     mod = 1 << 64
     un_data = list(unpack(data, 'Q'))
     a = 0
@@ -96,7 +120,7 @@ def fletcher2(data: bytes) -> ChecksumType:
     return a, b, c, d
 
 
-def fletcher4(data: bytes) -> ChecksumType:
+def fletcher4_python(data: bytes) -> ChecksumType:
     mod = 1 << 64
     a = 0
     b = 0
@@ -109,3 +133,63 @@ def fletcher4(data: bytes) -> ChecksumType:
         d = (d + c) % mod
 
     return a, b, c, d
+
+
+# words per block in the numpy fletcher implementations; small enough that
+# the per-block weights can't overflow 64 bits
+FLETCHER_BLOCK = 1 << 14
+
+
+@functools.lru_cache(maxsize=16)
+def _fletcher_weights(length: int, order: int):
+    # the word i places from the end of a block is added into the k-th running
+    # sum C(i + k, k) times, so each block's sums are a single matrix product
+    r = numpy.arange(length, 0, -1, dtype=numpy.uint64)
+    columns = [numpy.ones(length, dtype=numpy.uint64), r, r * (r + 1) // 2, r * (r + 1) * (r + 2) // 6]
+    return numpy.stack(columns[:order], axis=1)
+
+
+def _fletcher_sums(words, order: int) -> List[int]:
+    # the running sums of order 1..order over words, modulo 2**64
+    mod = 1 << 64
+    words = words.astype(numpy.uint64)
+    full = len(words) - len(words) % FLETCHER_BLOCK
+    blocks = []
+    if full:
+        partial = words[:full].reshape(-1, FLETCHER_BLOCK).dot(_fletcher_weights(FLETCHER_BLOCK, order))
+        blocks.append((FLETCHER_BLOCK, partial.tolist()))
+    if full != len(words):
+        tail = len(words) - full
+        partial = words[full:].reshape(1, -1).dot(_fletcher_weights(tail, order))
+        blocks.append((tail, partial.tolist()))
+    sums = [0] * order
+    for length, partials in blocks:
+        # carrying sums s_j over a block of m words adds C(m + k - j - 1, k - j) * s_j to s_k
+        carry = [1, length, length * (length + 1) // 2, length * (length + 1) * (length + 2) // 6]
+        for partial in partials:
+            sums = [
+                (partial[k] + sum(carry[k - j] * sums[j] for j in range(k + 1))) % mod
+                for k in range(order)
+            ]
+    return sums
+
+
+def fletcher2_numpy(data: bytes) -> ChecksumType:
+    words = numpy.frombuffer(data, dtype=numpy.uint64, count=len(data) // 16 * 2)
+    a, c = _fletcher_sums(words[0::2], 2)
+    b, d = _fletcher_sums(words[1::2], 2)
+    return a, b, c, d
+
+
+def fletcher4_numpy(data: bytes) -> ChecksumType:
+    words = numpy.frombuffer(data, dtype=numpy.uint32, count=len(data) // 4)
+    a, b, c, d = _fletcher_sums(words, 4)
+    return a, b, c, d
+
+
+if numpy is not None:
+    fletcher2 = fletcher2_numpy
+    fletcher4 = fletcher4_numpy
+else:
+    fletcher2 = fletcher2_python
+    fletcher4 = fletcher4_python
@@ -90,5 +90,33 @@ class VDev(object):
         data = self.read((offset, 0), dva.asize * 512)
         return data
 
+    def read_dva_into(self, dva: ondisk.dva, buffers: List[bytearray]) -> int:
+        # fills buffers from the start of dva, not necessarily all of its asize
+        offset = (dva.offset * 512) + 0x400000
+        return self.readv((offset, 0), buffers)
+
+    def absolute_offset(self, offset: Union[int, Tuple[int, int]]) -> int:
+        if isinstance(offset, int):
+            return offset
+        offset, whence = offset
+        if whence == os.SEEK_END:
+            return self.device_size() + offset
+        elif whence == os.SEEK_SET:
+            return offset
+        raise ValueError('unsupported whence {}'.format(whence))
+
+    def device_size(self) -> int:
+        raise NotImplementedError
+
     def read(self, offset: Union[int, Tuple[int, int]], size: int) -> bytes:
         raise NotImplementedError
+
+    def readv(self, offset: Union[int, Tuple[int, int]], buffers: List[bytearray]) -> int:
+        # fills each buffer in turn from consecutive bytes at offset
+        data = self.read(offset, sum(len(b) for b in buffers))
+        position = 0
+        for buf in buffers:
+            chunk = data[position:position + len(buf)]
+            memoryview(buf)[:len(chunk)] = chunk
+            position += len(chunk)
+        return position
@@ -0,0 +1,42 @@
+import threading
+
+from typing import Tuple
+
+DEFAULT_MAX_ENTRIES = 1 << 18
+
+
+class VerifiedSet(object):
+    '''The (vdev, offset, birth txg) keys of blocks whose checksums have
+    already been verified.
+
+    Keys are packed into a single int each, which takes a fraction of the
+    memory of a set of tuples. When the set fills up it is simply emptied;
+    the blocks in it get verified again the next time they are read.
+    '''
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.keys = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def pack(key: Tuple[int, int, int]) -> int:
+        vdev, offset, birth = key
+        # offsets are 63 bits and vdev ids 32
+        return (birth << 96) | (vdev << 64) | offset
+
+    def __contains__(self, key: Tuple[int, int, int]) -> bool:
+        return self.pack(key) in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: Tuple[int, int, int]) -> None:
+        with self.lock:
+            if len(self.keys) >= self.max_entries:
+                self.keys.clear()
+            self.keys.add(self.pack(key))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.keys.clear()
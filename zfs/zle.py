@@ -0,0 +1,92 @@
+'''Zero-length encoding, ZFS's compression for mostly-empty blocks.
+
+Each run starts with a length byte: below ZERO_RUN_START it's followed by
+that many literal bytes plus one, otherwise it stands for a run of zeros
+(length - ZERO_RUN_START + 1 of them).
+'''
+import re
+
+from typing import ByteString
+
+ZERO_RUN_START = 64
+LITERAL_RUN_MAX = ZERO_RUN_START
+ZERO_RUN_MAX = 256 - ZERO_RUN_START
+LONGEST_LITERAL_RUNS = re.compile(
+    b'(?:' + re.escape(bytes([LITERAL_RUN_MAX - 1])) + b'.{%d})+' % LITERAL_RUN_MAX, re.DOTALL)
+LONGEST_ZERO_RUNS = re.compile(b'\xff+')
+
+
+def decompress(bs: ByteString, size: int) -> bytes:
+    out = bytearray(size)
+    length = decompress_into(bs, out, zeroed=True)
+    if length < size:
+        del out[length:]
+    return bytes(out)
+
+
+def decompress_into(bs: ByteString, out, zeroed: bool = False) -> int:
+    '''Decode bs into the writable buffer out, stopping when either runs out.
+    Returns the number of bytes written. Pass zeroed=True if out is already
+    all zeros, and zero runs are skipped instead of written.'''
+    src = bytes(bs)
+    size = len(out)
+    slen = len(src)
+    pos = 0
+    op = 0
+    while pos < slen and op < size:
+        length = src[pos]
+        if length == LITERAL_RUN_MAX - 1:
+            # incompressible data is strings of the longest literal runs; copy
+            # them all at once, dropping the length bytes between them
+            match = LONGEST_LITERAL_RUNS.match(src, pos)
+            if match is not None:
+                runs = min((match.end() - pos) // (LITERAL_RUN_MAX + 1), -(-(size - op) // LITERAL_RUN_MAX))
+                literals = bytearray(src[pos:pos + runs * (LITERAL_RUN_MAX + 1)])
+                del literals[::LITERAL_RUN_MAX + 1]
+                length = min(len(literals), size - op)
+                out[op:op + length] = literals[:length]
+                pos += runs * (LITERAL_RUN_MAX + 1)
+                op += length
+                continue
+        pos += 1
+        if length < ZERO_RUN_START:
+            length = min(length + 1, slen - pos, size - op)
+            out[op:op + length] = src[pos:pos + length]
+            pos += length
+        else:
+            if length == 0xff:
+                # long stretches of zeros are strings of the longest runs; take them all at once
+                end = LONGEST_ZERO_RUNS.match(src, pos - 1).end()
+                length = min((end - pos + 1) * ZERO_RUN_MAX, size - op)
+                pos = end
+            else:
+                length = min(length - ZERO_RUN_START + 1, size - op)
+            if not zeroed:
+                out[op:op + length] = bytes(length)
+        op += length
+    return op
+
+
+def compress(bs: ByteString) -> bytes:
+    # the same algorithm as zle_compress in ZFS, for producing test data
+    src = bytes(bs)
+    slen = len(src)
+    dst = bytearray()
+    pos = 0
+    while pos < slen:
+        first = pos
+        if src[pos] == 0:
+            last = min(pos + 256 - ZERO_RUN_START, slen)
+            while pos < last and src[pos] == 0:
+                pos += 1
+            dst.append(pos - first - 1 + ZERO_RUN_START)
+        else:
+            last = min(pos + ZERO_RUN_START, slen)
+            # a literal run ends at the first pair of zeros
+            while pos < last - 1 and (src[pos] or src[pos + 1]):
+                pos += 1
+            if src[pos]:
+                pos += 1
+            dst.append(pos - first - 1)
+            dst += src[first:pos]
+    return bytes(dst)